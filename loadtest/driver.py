@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+from loadtest.fake_bot_api import FakeBotAPI, BOT_USER
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+FAKE_TOKEN = "123456789:AAFakeTokenForLoadTestingOnly000000"
+FIRST_USER_ID = 1000000000  # 10 цифр, как у настоящих ID
+
+class LoadDriver:
+    """
+    Имитирует пользователей, которые пишут боту через FakeBotAPI, и замеряет
+    время от отправки обновления до ответа бота.
+
+    Ответом на сообщение считается первый sendMessage в чат пользователя,
+    ответом на нажатие кнопки - answerCallbackQuery с тем же ID.
+    """
+
+    def __init__(self, api: FakeBotAPI, config: dict, timeout: float):
+        self.api = api
+        self.config = config
+        self.timeout = timeout
+        self.latencies = defaultdict(list)  # {команда: [секунды]}
+        self.timeouts = defaultdict(int)
+        self._waiting_messages = {}  # {chat_id: Future}
+        self._waiting_callbacks = {}  # {callback_query_id: Future}
+        self._callback_id = 0
+        api.on_call = self._on_call
+
+    def _on_call(self, method: str, params: dict):
+        if method == "sendMessage":
+            future = self._waiting_messages.pop(int(params["chat_id"]), None)
+        elif method == "answerCallbackQuery":
+            future = self._waiting_callbacks.pop(params["callback_query_id"], None)
+        else:
+            return
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load{user_id}"}
+
+    def _chat(self, user_id: int) -> dict:
+        return {"id": user_id, "type": "private"}
+
+    def _push_message(self, user_id: int, text: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting_messages[user_id] = future
+        self.api.push_update({"message": {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": self._chat(user_id),
+            "from": self._user(user_id),
+            "text": text,
+        }})
+        return future
+
+    def _push_callback(self, user_id: int, data: str) -> asyncio.Future:
+        self._callback_id += 1
+        callback_id = str(self._callback_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting_callbacks[callback_id] = future
+        self.api.push_update({"callback_query": {
+            "id": callback_id,
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": self.api.next_message_id(),
+                "date": int(time.time()),
+                "chat": self._chat(user_id),
+                "from": BOT_USER,
+                "text": self.config['messages']['control_panel'],
+            },
+        }})
+        return future
+
+    async def request(self, user_id: int, command: str):
+        """Отправляет одну команду от пользователя и ждёт ответа бота"""
+        is_callback = command.startswith("callback:")
+        if is_callback:
+            future = self._push_callback(user_id, command.split(":", 1)[1])
+        else:
+            future = self._push_message(user_id, command)
+
+        started = time.perf_counter()
+        try:
+            finished = await asyncio.wait_for(future, self.timeout)
+            self.latencies[command].append(finished - started)
+        except asyncio.TimeoutError:
+            if not is_callback:
+                self._waiting_messages.pop(user_id, None)
+            self.timeouts[command] += 1
+
+    async def run(self, user_ids: list, commands: list, requests_per_user: int, concurrency: int) -> float:
+        """Запускает сценарий и возвращает его длительность в секундах"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def simulate_user(user_id: int):
+            async with semaphore:
+                for _ in range(requests_per_user):
+                    await self.request(user_id, random.choice(commands))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate_user(user_id) for user_id in user_ids))
+        return time.perf_counter() - started
+
+def percentile(values: list, percent: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def print_report(driver: LoadDriver, api: FakeBotAPI, duration: float):
+    print(f"\n{'Команда':<34}{'успешно':>9}{'таймаут':>9}{'RPS':>9}{'p50, мс':>10}{'p99, мс':>10}")
+    commands = sorted(set(driver.latencies) | set(driver.timeouts))
+    all_latencies = []
+    for command in commands:
+        latencies = driver.latencies[command]
+        all_latencies.extend(latencies)
+        p50 = f"{percentile(latencies, 50) * 1000:.1f}" if latencies else "-"
+        p99 = f"{percentile(latencies, 99) * 1000:.1f}" if latencies else "-"
+        print(f"{command:<34}{len(latencies):>9}{driver.timeouts[command]:>9}"
+              f"{len(latencies) / duration:>9.1f}{p50:>10}{p99:>10}")
+
+    total_timeouts = sum(driver.timeouts.values())
+    if all_latencies:
+        print(f"{'Всего':<34}{len(all_latencies):>9}{total_timeouts:>9}{len(all_latencies) / duration:>9.1f}"
+              f"{percentile(all_latencies, 50) * 1000:>10.1f}{percentile(all_latencies, 99) * 1000:>10.1f}")
+
+    print(f"\nДлительность: {duration:.1f} с")
+    print("Вызовы Bot API: " + ", ".join(f"{method}={count}" for method, count in sorted(api.calls.items())))
+    if api.rate_limited:
+        print("Ответы 429: " + ", ".join(f"{method}={count}" for method, count in sorted(api.rate_limited.items())))
+
+def write_bot_config(base_config: dict, workdir: Path, api_url: str, admin_ids: list) -> Path:
+    """Готовит конфиг и файлы доступов для бота, запускаемого под нагрузкой"""
+    config = json.loads(json.dumps(base_config))
+    config['bot_token'] = FAKE_TOKEN
+    config['api_server'] = api_url
+    config['scheduler']['is_activated'] = False
+    config['calendar']['port'] = 0  # Любой свободный порт, чтобы не мешать запущенному боту
+
+    # Все имитируемые пользователи - администраторы, чтобы кнопки панели управления отрабатывали полностью
+    admins_file = workdir / "administrators.txt"
+    admins_file.write_text("".join(f"{user_id}\n" for user_id in admin_ids))
+    (workdir / "permissions.txt").write_text("")
+    (workdir / "blacklist.txt").write_text("")
+    config['files']['admins_file'] = str(admins_file)
+    config['files']['permissions_file'] = str(workdir / "permissions.txt")
+    config['files']['blacklist_file'] = str(workdir / "blacklist.txt")
+    config['files']['subscriptions_file'] = str(workdir / "subscriptions.json")
+    config['files']['history_dir'] = str(workdir / "history")
+    config['files']['schedule_file'] = str(ROOT_DIR / base_config['files']['schedule_file'])
+
+    config_path = workdir / "config.json"
+    config_path.write_text(json.dumps(config, ensure_ascii=False), encoding='utf-8')
+    (workdir / "logs").mkdir(exist_ok=True)
+    return config_path
+
+async def start_bot(config_path: Path, workdir: Path, show_log: bool) -> asyncio.subprocess.Process:
+    # Рабочая директория - временная, чтобы логи нагрузки не попадали в logs/bot.log репозитория
+    return await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT_DIR / "main.py"),
+        cwd=str(workdir),
+        env={**os.environ, "BOT_CONFIG": str(config_path)},
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=None if show_log else asyncio.subprocess.DEVNULL,
+    )
+
+async def main(args: argparse.Namespace):
+    with open(args.config, 'r', encoding='utf-8') as config_file:
+        base_config = json.load(config_file)
+
+    api = FakeBotAPI(
+        latency=args.latency, jitter=args.jitter,
+        rate_limit_probability=args.rate_limit, retry_after=args.retry_after
+        )
+    runner = await api.start(args.host, args.port)
+
+    user_ids = [FIRST_USER_ID + i for i in range(args.users)]
+    commands = args.commands or [
+        "/today", "/tomorrow", base_config['buttons_text']['reply']['today'],
+        "callback:permissions", "callback:list_ids:permissions", "callback:back_to_control",
+    ]
+
+    bot_process: Optional[asyncio.subprocess.Process] = None
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        try:
+            if args.no_spawn:
+                print(f"Ожидание бота с api_server = http://{args.host}:{args.port} ...")
+            else:
+                config_path = write_bot_config(base_config, workdir, f"http://{args.host}:{args.port}", user_ids)
+                bot_process = await start_bot(config_path, workdir, args.show_bot_log)
+            await asyncio.wait_for(api.polling_started.wait(), args.startup_timeout)
+
+            driver = LoadDriver(api, base_config, args.timeout)
+            print(f"Пользователей: {args.users}, запросов на пользователя: {args.requests_per_user}, "
+                  f"одновременно: {args.concurrency}")
+            duration = await driver.run(user_ids, commands, args.requests_per_user, args.concurrency)
+            print_report(driver, api, duration)
+        finally:
+            if bot_process is not None and bot_process.returncode is None:
+                bot_process.terminate()
+                await bot_process.wait()
+            await runner.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование бота на локальном Fake Bot API")
+    parser.add_argument("--config", default=str(ROOT_DIR / "config.json"), help="исходный конфиг бота")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=1000, help="количество пользователей")
+    parser.add_argument("--requests-per-user", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=200, help="пользователей одновременно")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, с")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="вероятность ответа 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument("--timeout", type=float, default=30.0, help="ожидание ответа бота, с")
+    parser.add_argument("--startup-timeout", type=float, default=30.0, help="ожидание запуска бота, с")
+    parser.add_argument("--commands", nargs="+", help="команды для имитации (по умолчанию - набор команд и кнопок)")
+    parser.add_argument("--no-spawn", action="store_true", help="не запускать main.py, бот уже запущен")
+    parser.add_argument("--show-bot-log", action="store_true", help="выводить лог запущенного бота")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 100000000, "is_bot": True, "first_name": "Fake Bot", "username": "fake_schedule_bot"}
+
+class FakeBotAPI:
+    """
+    Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+    Реализует только методы, которыми пользуется бот. Обновления для getUpdates
+    добавляются через push_update, а каждый вызов метода передаётся в on_call,
+    чтобы драйвер мог замерить время ответа бота.
+
+    Args:
+        latency (float): Базовая задержка ответа на каждый метод, в секундах
+        jitter (float): Случайная добавка к задержке, от 0 до jitter секунд
+        rate_limit_probability (float): Вероятность ответить 429 вместо результата
+        retry_after (int): Значение retry_after в ответах 429
+        member_ids (Optional[set]): ID участников группы для getChatMember (None - все участники)
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_probability: float = 0.0,
+                 retry_after: int = 1, member_ids: Optional[set] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.member_ids = member_ids
+
+        self.on_call: Optional[Callable[[str, dict], None]] = None
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.files = {}  # {file_id: bytes}
+        self.answered_callbacks = set()
+        self.polling_started = asyncio.Event()
+
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._last_update_id = 0
+        self._last_message_id = 0
+
+        self._methods = {
+            "getMe": self._get_me,
+            "getUpdates": self._get_updates,
+            "sendMessage": self._send_message,
+            "setMessageReaction": self._return_true,
+            "getChatMember": self._get_chat_member,
+            "sendDocument": self._send_document,
+            "getFile": self._get_file,
+            "deleteMessage": self._return_true,
+            "editMessageText": self._edit_message_text,
+            "answerCallbackQuery": self._return_true,
+        }
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Fake Bot API запущен на http://%s:%s", host, port)
+        return runner
+
+    def next_message_id(self) -> int:
+        self._last_message_id += 1
+        return self._last_message_id
+
+    def push_update(self, update: dict) -> int:
+        """Ставит обновление в очередь getUpdates и возвращает его update_id"""
+        self._last_update_id += 1
+        update["update_id"] = self._last_update_id
+        self._updates.append(update)
+        self._new_updates.set()
+        return self._last_update_id
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        handler = self._methods.get(method)
+        if handler is None:
+            return self._error(404, "Not Found: method not found")
+
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+
+        # getUpdates - long polling, задержки и 429 к нему не применяются
+        if method != "getUpdates":
+            self.calls[method] += 1
+            if self.latency or self.jitter:
+                await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            if self.rate_limit_probability and random.random() < self.rate_limit_probability:
+                self.rate_limited[method] += 1
+                return self._error(
+                    429,
+                    f"Too Many Requests: retry after {self.retry_after}",
+                    parameters={"retry_after": self.retry_after}
+                    )
+
+        # Как и настоящий Bot API, на один callback можно ответить только один раз
+        if method == "answerCallbackQuery":
+            if params.get("callback_query_id") in self.answered_callbacks:
+                return self._error(400, "Bad Request: query is too old and response timeout expired or query ID is invalid")
+            self.answered_callbacks.add(params.get("callback_query_id"))
+
+        result = await handler(params)
+        if method != "getUpdates" and self.on_call is not None:
+            self.on_call(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id])
+
+    def _error(self, code: int, description: str, parameters: Optional[dict] = None) -> web.Response:
+        payload = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            payload["parameters"] = parameters
+        return web.json_response(payload, status=code)
+
+    def _message(self, chat_id, message_id: Optional[int] = None, **fields) -> dict:
+        chat_id = int(chat_id)
+        message = {
+            "message_id": message_id or self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        return message
+
+    async def _return_true(self, params: dict) -> bool:
+        return True
+
+    async def _get_me(self, params: dict) -> dict:
+        return BOT_USER
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        limit = int(params.get("limit", 100))
+        self.polling_started.set()
+
+        # Обновления с update_id < offset подтверждены ботом
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    async def _send_message(self, params: dict) -> dict:
+        return self._message(params["chat_id"], text=params.get("text", ""))
+
+    async def _edit_message_text(self, params: dict) -> dict:
+        return self._message(params["chat_id"], int(params["message_id"]), text=params.get("text", ""))
+
+    async def _send_document(self, params: dict) -> dict:
+        file_id = f"document{self.next_message_id()}"
+        return self._message(
+            params["chat_id"],
+            document={"file_id": file_id, "file_unique_id": file_id},
+            caption=params.get("caption", "")
+            )
+
+    async def _get_chat_member(self, params: dict) -> dict:
+        user_id = int(params["user_id"])
+        is_member = self.member_ids is None or user_id in self.member_ids
+        return {
+            "status": "member" if is_member else "left",
+            "user": {"id": user_id, "is_bot": False, "first_name": "User"},
+        }
+
+    async def _get_file(self, params: dict) -> dict:
+        file_id = params["file_id"]
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": len(self.files.get(file_id, b"")),
+            "file_path": f"documents/{file_id}",
+        }
+
+async def serve(host: str, port: int, **options):
+    api = FakeBotAPI(**options)
+    await api.start(host, port)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="вероятность ответа 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, с")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(
+        args.host, args.port,
+        latency=args.latency, jitter=args.jitter,
+        rate_limit_probability=args.rate_limit, retry_after=args.retry_after
+        ))
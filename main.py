@@ -1,16 +1,18 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command # , CommandStart
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject # , CommandStart
 from aiogram.types import FSInputFile, ReactionTypeEmoji, InlineKeyboardButton
 from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import json
 import os
+from html import escape
 from datetime import datetime, timedelta
 from pathlib import Path
-from aiocron import crontab
 # from typing import Callable, Dict, Any, Awaitable
+from modules.config_service import ConfigService
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,12 +25,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Загрузка конфигурации
-with open('config.json', 'r', encoding='utf-8') as config_file:
-    config = json.load(config_file)
+# Загрузка конфигурации (путь можно переопределить переменной окружения BOT_CONFIG)
+# Конфиг перечитывается без перезапуска при изменении файла (см. apply_config)
+config_service = ConfigService(os.environ.get('BOT_CONFIG', 'config.json'))
+config = config_service.config
+# Шаблоны сообщений, разобранные при загрузке конфига
+messages = config['messages']
+logger_messages = config['logger_messages']
 
 # Инициализация бота и диспетчера
-bot = Bot(token=config['bot_token']) # Замените YOUR_TOKEN_HERE в конфиге на токен вашего бота
+# Если в конфиге указан api_server, запросы идут на него вместо api.telegram.org (например, на loadtest/fake_bot_api.py)
+session = AiohttpSession(api=TelegramAPIServer.from_base(config['api_server'])) if config.get('api_server') else None
+bot = Bot(token=config['bot_token'], session=session) # Замените YOUR_TOKEN_HERE в конфиге на токен вашего бота
 dp = Dispatcher()
 
 # Глобальные переменные из конфига
@@ -37,6 +45,8 @@ PERMISSIONS_FILE = str(Path(__file__).parent / config['files']['permissions_file
 ADMINS_FILE = str(Path(__file__).parent / config['files']['admins_file'])
 BLACKLIST_FILE = str(Path(__file__).parent / config['files']['blacklist_file'])
 SCHEDULE_FILE = str(Path(__file__).parent / config['files']['schedule_file'])
+SUBSCRIPTIONS_FILE = str(Path(__file__).parent / config['files']['subscriptions_file'])
+HISTORY_DIR = str(Path(__file__).parent / config['files']['history_dir'])
 
 # Словарь для хранения состояния ожидания файла и прочих состояний
 user_states = {}  # {user_id: {'state': 'waiting_for_file/file_action', 'file_type': 'permissions/admins/blacklist', 'action': 'add/remove'}}
@@ -44,9 +54,56 @@ waiting_for_file = {}
 user_messages = {}
 
 # Импорт модулей
-from modules.permission_checker import check_user_permission, manage_user_id
-from modules.schedule_parser import parse_schedule_for_today, parse_schedule_for_tomorrow, months
-from modules.file_handler import download_schedule
+from modules.permission_checker import check_user_permission, manage_user_id, manage_user_ids, parse_ids, read_ids_page
+from modules.schedule_parser import parse_schedule_for_today, parse_schedule_for_tomorrow, months, get_schedule, parse_date_argument
+from modules.schedule_search import search_schedule, get_search_index
+from modules.schedule_occupancy import get_occupancy_index, find_free_rooms, find_teachers, teacher_availability, invalidate_occupancy_index
+from modules.scheduler import Scheduler, cron_next, daily_next
+from modules.subscriptions import MODES, parse_time, load_subscriptions, save_subscriptions
+from modules.calendar_feed import start_calendar_server, feed_url, invalidate_feeds
+from modules.schedule_history import list_versions, record_current, rollback, download_blocked_since
+from modules.file_handler import download_schedule, install_schedule, get_breaker_state
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+background_tasks = set()
+
+# Функция для запуска запроса к Bot API без ожидания ответа (fire-and-forget)
+# Методы aiogram (message.react и т.п.) возвращают awaitable-объекты, а не корутины, поэтому ensure_future
+def run_in_background(awaitable):
+    task = asyncio.ensure_future(awaitable)
+    background_tasks.add(task)
+    task.add_done_callback(background_task_done)
+    return task
+
+def background_task_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(logger_messages['background_error'].format(e=task.exception()))
+
+# Функция для одновременной отправки нескольких запросов к Bot API.
+# asyncio.gather требует хэшируемые аргументы, а методы aiogram (pydantic-модели) не хэшируются, поэтому каждый оборачивается в задачу
+async def gather_requests(*requests):
+    return await asyncio.gather(*(asyncio.ensure_future(request) for request in requests))
+
+# Планировщик: рассылка в группу, прогрев перед ней и персональные рассылки подписчиков - на одной задаче
+scheduler = Scheduler(config)
+subscriptions = load_subscriptions(SUBSCRIPTIONS_FILE, config)  # {user_id: {'mode': 'morning/evening', 'time': 'ЧЧ:ММ'}}
+delivery_semaphore = asyncio.Semaphore(config['scheduler']['delivery_concurrency'])
+
+# Функция прогрева: заранее обновляет файл и разбирает расписание, чтобы рассылка брала всё из кэша
+async def prewarm_schedule():
+    started = datetime.now()
+    # Если сайт недоступен или не успел ответить - рассылается последняя проверенная версия расписания
+    if config['fetch']['refresh_before_broadcast']:
+        if not await download_schedule(SCHEDULE_FILE, config, deadline=config['fetch']['broadcast_deadline'], history_dir=HISTORY_DIR):
+            logger.warning(logger_messages['broadcast_last_good'])
+
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    if schedule is not None:
+        get_search_index(schedule)
+        get_occupancy_index(schedule, config)
+        logger.info(logger_messages['prewarm_done'].format(
+            version=schedule['version'], seconds=round((datetime.now() - started).total_seconds(), 1)))
 
 # Функция для отправки расписания в группу
 async def send_schedule():
@@ -58,22 +115,60 @@ async def send_schedule():
         if schedule_text:
             await bot.send_message(
                 GROUP_ID,
-                f"{config['messages']['good_evening']}\n{config['messages']['schedule_for_tomorrow'].format(tomorrow_str=tomorrow_str)}\n\n{schedule_text}",
+                f"{messages['good_evening']}\n{messages['schedule_for_tomorrow'].format(tomorrow_str=tomorrow_str)}\n\n{schedule_text}",
                 parse_mode=ParseMode.HTML
             )
-            logger.info(config['logger_messages']['group_sended'])
+            logger.info(logger_messages['group_sended'])
         else:
-            await bot.send_message(GROUP_ID, config["messages"]["schedule_not_found"])
-            logger.warning(config['logger_messages']['group_no_schedule'])
+            await bot.send_message(GROUP_ID, messages["schedule_not_found"])
+            logger.warning(logger_messages['group_no_schedule'])
     except Exception as e:
-        logger.error(config['logger_messages']['send_error'].format(e=e))
+        logger.error(logger_messages['send_error'].format(e=e))
+
+# Функция персональной рассылки: "morning" - расписание на сегодня, "evening" - на завтра
+async def send_subscription(user_id: int):
+    subscription = subscriptions.get(user_id)
+    if subscription is None:
+        return
+
+    async with delivery_semaphore:
+        try:
+            # Доступ проверяется при каждой отправке: пользователь мог покинуть группу или попасть в ЧС
+            has_permission = await check_user_permission(bot, False, GROUP_ID, PERMISSIONS_FILE, BLACKLIST_FILE, user_id, config)
+            if has_permission is not True:
+                logger.warning(logger_messages['subscription_no_access'].format(user_id=user_id))
+                return
+
+            if subscription['mode'] == "morning":
+                target_date = datetime.now()
+                schedule_text = await parse_schedule_for_today(SCHEDULE_FILE, config)
+                header = messages['schedule_for_today'].format(today_str=f"{target_date.day} {months[target_date.month]}")
+            else:
+                target_date = datetime.now() + timedelta(days=1)
+                schedule_text = await parse_schedule_for_tomorrow(SCHEDULE_FILE, config)
+                header = messages['schedule_for_tomorrow'].format(tomorrow_str=f"{target_date.day} {months[target_date.month]}")
+
+            # В дни без занятий (или без расписания) подписчиков не беспокоим
+            if not schedule_text:
+                logger.info(logger_messages['subscription_empty'].format(user_id=user_id, date_str=f"{target_date.day} {months[target_date.month]}"))
+                return
+
+            await bot.send_message(user_id, f"{header}\n\n{schedule_text}", parse_mode=ParseMode.HTML)
+            logger.info(logger_messages['subscription_sended'].format(user_id=user_id, mode=subscription['mode']))
+        except Exception as e:
+            logger.error(logger_messages['send_error'].format(e=e))
+
+# Функция для постановки подписки в планировщик (повторный вызов заменяет задание)
+def schedule_subscription(user_id: int):
+    subscription = subscriptions[user_id]
+    scheduler.add_job(f"subscription:{user_id}", daily_next(subscription['time']), lambda: send_subscription(user_id))
 
 # Обработчик команды /start
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
-    logger.info(config['logger_messages']['start_received'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['start_received'].format(username=username, user_id=user_id))
 
     keyboard = types.ReplyKeyboardMarkup(
         resize_keyboard=True,
@@ -84,7 +179,7 @@ async def start_command(message: types.Message):
     )
 
     await message.answer(
-        config["messages"]["start_message"], 
+        messages["start_message"], 
         reply_markup=keyboard, 
         parse_mode=ParseMode.HTML
         )
@@ -94,22 +189,22 @@ async def start_command(message: types.Message):
 async def get_file(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
-    logger.info(config['logger_messages']['user_try_getfile'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['user_try_getfile'].format(username=username, user_id=user_id))
 
     try:
         file = FSInputFile(SCHEDULE_FILE)
-        await message.answer_document(file, caption=config["messages"]["file_description"])
-        logger.info(config['logger_messages']['getfile_sended'].format(username=username, user_id=user_id))
+        await message.answer_document(file, caption=messages["file_description"])
+        logger.info(logger_messages['getfile_sended'].format(username=username, user_id=user_id))
     except FileNotFoundError:
-        await message.answer(config['messages']['file_not_found'])
-        logger.error(config['logger_messages']['getfile_not_found'])
+        await message.answer(messages['file_not_found'])
+        logger.error(logger_messages['getfile_not_found'])
 
 # Обработчик команды /today
 @dp.message(Command("today"))
 async def today_command(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
-    logger.info(config['logger_messages']['user_try_today'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['user_try_today'].format(username=username, user_id=user_id))
 
     today = datetime.now()
     today_str = f"{today.day} {months[today.month]}"
@@ -119,27 +214,30 @@ async def today_command(message: types.Message):
         await message.react([ReactionTypeEmoji(emoji=config['reactions']['banned'])])
     else:
         if has_permission:
-            await message.react([ReactionTypeEmoji(emoji=config['reactions']['parsing'])])
+            # Реакция уходит параллельно с парсингом и не задерживает ответ
+            run_in_background(message.react([ReactionTypeEmoji(emoji=config['reactions']['parsing'])]))
             schedule_text = await parse_schedule_for_today(SCHEDULE_FILE, config)
             if schedule_text:
                 await message.answer(
-                    f"{config['messages']['schedule_for_today'].format(today_str=today_str)}\n\n{schedule_text}", 
+                    f"{messages['schedule_for_today'].format(today_str=today_str)}\n\n{schedule_text}", 
                     parse_mode=ParseMode.HTML
                     )
-                logger.info(config['logger_messages']['today_sended'].format(today_str=today_str))
+                logger.info(logger_messages['today_sended'].format(today_str=today_str))
             else:
-                await message.answer(config["messages"]["schedule_not_found"])
-                logger.warning(config['logger_messages']['today_not_found'].format(today_str=today_str))
+                await message.answer(messages["schedule_not_found"])
+                logger.warning(logger_messages['today_not_found'].format(today_str=today_str))
         else:
-            await message.react([ReactionTypeEmoji(emoji=config['reactions']['no_permission'])])
-            await message.answer(config["messages"]["no_permission"])
+            await gather_requests(
+                message.react([ReactionTypeEmoji(emoji=config['reactions']['no_permission'])]),
+                message.answer(messages["no_permission"])
+                )
 
 # Обработчик команды /tomorrow
 @dp.message(Command("tomorrow"))
 async def tomorrow_command(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
-    logger.info(config['logger_messages']['user_try_tomorrow'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['user_try_tomorrow'].format(username=username, user_id=user_id))
 
     tomorrow = datetime.now() + timedelta(days=1)
     tomorrow_str = f"{tomorrow.day} {months[tomorrow.month]}"
@@ -149,20 +247,258 @@ async def tomorrow_command(message: types.Message):
         await message.react([ReactionTypeEmoji(emoji=config['reactions']['banned'])])
     else:
         if has_permission:
-            await message.react([ReactionTypeEmoji(emoji=config['reactions']['parsing'])])
+            # Реакция уходит параллельно с парсингом и не задерживает ответ
+            run_in_background(message.react([ReactionTypeEmoji(emoji=config['reactions']['parsing'])]))
             schedule_text = await parse_schedule_for_tomorrow(SCHEDULE_FILE, config)
             if schedule_text:
                 await message.answer(
-                    f"{config['messages']['schedule_for_tomorrow'].format(tomorrow_str=tomorrow_str)}\n\n{schedule_text}", 
+                    f"{messages['schedule_for_tomorrow'].format(tomorrow_str=tomorrow_str)}\n\n{schedule_text}", 
                     parse_mode=ParseMode.HTML
                     )
-                logger.info(config['logger_messages']['tomorrow_sended'].format(tomorrow_str=tomorrow_str))
+                logger.info(logger_messages['tomorrow_sended'].format(tomorrow_str=tomorrow_str))
             else:
-                await message.answer(config["messages"]["schedule_not_found"])
-                logger.warning(config['logger_messages']['tomorrow_not_found'].format(tomorrow_str=tomorrow_str))
+                await message.answer(messages["schedule_not_found"])
+                logger.warning(logger_messages['tomorrow_not_found'].format(tomorrow_str=tomorrow_str))
         else:
-            await message.react([ReactionTypeEmoji(emoji=config['reactions']['no_permission'])])
-            await message.answer(config["messages"]["no_permission"])
+            await gather_requests(
+                message.react([ReactionTypeEmoji(emoji=config['reactions']['no_permission'])]),
+                message.answer(messages["no_permission"])
+                )
+
+# Функция проверки доступа к командам с расписанием (реакции на бан и отсутствие прав отправляет сама)
+async def check_schedule_access(message: types.Message, user_id: int) -> bool:
+    has_permission = await check_user_permission(bot, False, GROUP_ID, PERMISSIONS_FILE, BLACKLIST_FILE, user_id, config)
+    if has_permission == "Banned":
+        await message.react([ReactionTypeEmoji(emoji=config['reactions']['banned'])])
+        return False
+    if not has_permission:
+        await gather_requests(
+            message.react([ReactionTypeEmoji(emoji=config['reactions']['no_permission'])]),
+            message.answer(messages["no_permission"])
+            )
+        return False
+    return True
+
+# Обработчик команды /find (поиск по всему расписанию: преподаватель, кабинет, предмет, группа)
+@dp.message(Command("find"))
+async def find_command(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    query = (command.args or "").strip()
+    logger.info(logger_messages['user_try_find'].format(username=username, user_id=user_id, query=query))
+
+    if not query:
+        await message.answer(messages['find_usage'])
+        return
+
+    # Последнее слово запроса может быть датой: сегодня, завтра, ДД.ММ
+    words = query.split()
+    target_date = parse_date_argument(words[-1], config) if len(words) > 1 else None
+    if target_date:
+        query = " ".join(words[:-1])
+
+    if not await check_schedule_access(message, user_id):
+        return
+
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    results = search_schedule(schedule, query, target_date) if schedule else []
+
+    if results:
+        max_results = config['search']['max_results']
+        lines = [messages['find_results'].format(query=escape(query), count=len(results))]
+        for entry in results[:max_results]:
+            lesson = ", ".join(entry['lines'])
+            if entry['rooms']:
+                lesson += f" ({', '.join(entry['rooms'])})"
+            lines.append(messages['find_entry'].format(
+                date_str=entry['date_str'],
+                time=escape(entry['time'] or ""),
+                group=escape(entry['group']),
+                lesson=escape(lesson)
+                ))
+        if len(results) > max_results:
+            lines.append(messages['find_more'].format(rest=len(results) - max_results))
+
+        await message.answer("\n\n".join(lines), parse_mode=ParseMode.HTML)
+        logger.info(logger_messages['find_sended'].format(query=query, count=len(results)))
+    else:
+        await message.answer(messages['find_not_found'].format(query=escape(query)), parse_mode=ParseMode.HTML)
+
+# Обработчик команды /freerooms [дата] [пара] (свободные кабинеты)
+@dp.message(Command("freerooms"))
+async def freerooms_command(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    args = (command.args or "").split()
+    logger.info(logger_messages['user_try_freerooms'].format(username=username, user_id=user_id, args=" ".join(args)))
+
+    # Аргументы в любом порядке: номер пары (1-2 цифры) и дата
+    target_date = datetime.now()
+    pair = None
+    for arg in args:
+        if arg.isdigit() and len(arg) <= 2:
+            pair = int(arg)
+            if pair < 1:
+                await message.answer(messages['freerooms_usage'])
+                return
+        else:
+            target_date = parse_date_argument(arg, config)
+            if target_date is None:
+                await message.answer(messages['freerooms_usage'])
+                return
+
+    if not await check_schedule_access(message, user_id):
+        return
+
+    date_str = f"{target_date.day} {months[target_date.month]}"
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    index = get_occupancy_index(schedule, config) if schedule else None
+    slots = find_free_rooms(index, target_date, pair - 1 if pair is not None else None) if index else None
+
+    if index is not None and not index['rooms']:
+        # Без списка кабинетов любой блок выглядел бы занятым
+        await message.answer(messages['freerooms_rooms_unknown'])
+    elif slots is None:
+        await message.answer(messages['day_not_found'].format(date_str=date_str))
+    elif not slots:
+        await message.answer(messages['pair_not_found'].format(date_str=date_str, pair=pair))
+    else:
+        lines = [messages['freerooms_header'].format(date_str=date_str)]
+        for number, time_value, rooms in slots:
+            lines.append(messages['freerooms_slot'].format(
+                pair=number + 1,
+                time=escape(time_value or ""),
+                rooms=escape(", ".join(rooms)) if rooms else messages['freerooms_none']
+                ))
+        await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
+
+# Обработчик команды /teacher <фамилия> [дата] (занятость преподавателя)
+@dp.message(Command("teacher"))
+async def teacher_command(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    query = (command.args or "").strip()
+    logger.info(logger_messages['user_try_teacher'].format(username=username, user_id=user_id, query=query))
+
+    if not query:
+        await message.answer(messages['teacher_usage'])
+        return
+
+    # Последнее слово запроса может быть датой: сегодня, завтра, ДД.ММ
+    words = query.split()
+    target_date = parse_date_argument(words[-1], config) if len(words) > 1 else None
+    if target_date:
+        query = " ".join(words[:-1])
+    else:
+        target_date = datetime.now()
+
+    if not await check_schedule_access(message, user_id):
+        return
+
+    date_str = f"{target_date.day} {months[target_date.month]}"
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    index = get_occupancy_index(schedule, config) if schedule else None
+    teachers = find_teachers(index, query) if index else []
+
+    if not teachers:
+        await message.answer(messages['teacher_not_found'].format(query=escape(query)), parse_mode=ParseMode.HTML)
+    elif len(teachers) > 1:
+        await message.answer(
+            messages['teacher_ambiguous'].format(query=escape(query), teachers=escape("\n".join(teachers[:10]))),
+            parse_mode=ParseMode.HTML
+            )
+    else:
+        teacher = teachers[0]
+        slots = teacher_availability(index, teacher, target_date)
+        if slots is None:
+            await message.answer(messages['day_not_found'].format(date_str=date_str))
+            return
+
+        lines = [messages['teacher_header'].format(teacher=escape(teacher), date_str=date_str)]
+        for number, time_value, lesson in slots:
+            if lesson:
+                lines.append(messages['teacher_busy'].format(
+                    pair=number + 1,
+                    time=escape(time_value or ""),
+                    group=escape(lesson['group']),
+                    subject=escape(lesson['subject'] + (f" ({', '.join(lesson['rooms'])})" if lesson['rooms'] else ""))
+                    ))
+            else:
+                lines.append(messages['teacher_free'].format(pair=number + 1, time=escape(time_value or "")))
+        await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
+
+# Обработчик команды /subscribe: /subscribe утро|вечер [ЧЧ:ММ]
+@dp.message(Command("subscribe"))
+async def subscribe_command(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    logger.info(logger_messages['user_try_subscribe'].format(username=username, user_id=user_id, args=command.args))
+
+    if not await check_schedule_access(message, user_id):
+        return
+
+    mode_names = config['subscriptions']['mode_names']
+    args = (command.args or "").split()
+    mode = next((mode for mode in MODES if args and args[0].lower() == mode_names[mode]), None)
+    delivery_time = parse_time(args[1]) if len(args) > 1 else None
+    if mode is None or len(args) > 2 or (len(args) == 2 and delivery_time is None):
+        current = subscriptions.get(user_id)
+        status = messages['subscription_current'].format(mode=mode_names[current['mode']], time=current['time']) \
+            if current else messages['subscription_none']
+        await message.answer(f"{messages['subscribe_usage']}\n\n{status}")
+        return
+
+    subscriptions[user_id] = {'mode': mode, 'time': delivery_time or config['scheduler']['delivery_times'][mode]}
+    if not save_subscriptions(SUBSCRIPTIONS_FILE, subscriptions, config):
+        await message.answer(messages['subscription_error'])
+        return
+    schedule_subscription(user_id)
+
+    logger.info(logger_messages['subscription_saved'].format(user_id=user_id, mode=mode, time=subscriptions[user_id]['time']))
+    await message.answer(messages['subscription_saved'].format(mode=mode_names[mode], time=subscriptions[user_id]['time']))
+
+# Обработчик команды /unsubscribe
+@dp.message(Command("unsubscribe"))
+async def unsubscribe_command(message: types.Message):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    logger.info(logger_messages['user_try_unsubscribe'].format(username=username, user_id=user_id))
+
+    if subscriptions.pop(user_id, None) is None:
+        await message.answer(messages['subscription_none'])
+        return
+    scheduler.remove_job(f"subscription:{user_id}")
+    save_subscriptions(SUBSCRIPTIONS_FILE, subscriptions, config)
+    await message.answer(messages['subscription_removed'])
+
+# Обработчик команды /calendar: /calendar [группа]
+@dp.message(Command("calendar"))
+async def calendar_command(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    username = message.from_user.username or "No username"
+    logger.info(logger_messages['user_try_calendar'].format(username=username, user_id=user_id, args=command.args))
+
+    if not config['calendar']['is_activated']:
+        await message.answer(messages['calendar_disabled'])
+        return
+
+    if not await check_schedule_access(message, user_id):
+        return
+
+    group = (command.args or config['schedule_parser']['group_name']).strip()
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    if schedule is None:
+        await message.answer(messages["schedule_not_found"])
+        return
+    if not any(group in day['groups'] for day in schedule['days']):
+        groups = sorted({name for day in schedule['days'] for name in day['groups']})
+        await message.answer(messages['calendar_group_not_found'].format(group=escape(group), groups=escape(", ".join(groups))), parse_mode=ParseMode.HTML)
+        return
+
+    await message.answer(
+        messages['calendar_link'].format(group=escape(group), url=escape(feed_url(group, config))),
+        parse_mode=ParseMode.HTML
+        )
 
 # Обработчик команды /ping
 @dp.message(Command("ping"))
@@ -170,10 +506,12 @@ async def ping_command(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
 
-    logger.info(config['logger_messages']['user_ping'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['user_ping'].format(username=username, user_id=user_id))
     
-    await message.react([ReactionTypeEmoji(emoji=config['reactions']['ping'])])
-    await message.answer(config["messages"]["ping_success"])
+    await gather_requests(
+        message.react([ReactionTypeEmoji(emoji=config['reactions']['ping'])]),
+        message.answer(messages["ping_success"])
+        )
 
 # Функция для создания клавиатуры панели управления
 def get_control_panel_keyboard():
@@ -189,8 +527,43 @@ def get_control_panel_keyboard():
         InlineKeyboardButton(text=config['buttons_text']['inline']['admins'], callback_data="admins"),
         InlineKeyboardButton(text=config['buttons_text']['inline']['blacklist'], callback_data="blacklist"),
     )
+    breaker = get_breaker_state(config['url_parser']['schedule_page_url'], config)
+    builder.row(InlineKeyboardButton(
+        text=config['buttons_text']['inline']['source_status'].format(state=config['breaker_states'][breaker['state']]),
+        callback_data="source_status"
+        ))
+    builder.row(InlineKeyboardButton(text=config['buttons_text']['inline']['history'], callback_data="history"))
     return builder.as_markup()
 
+# Функция для создания клавиатуры истории версий расписания (кнопки отката ко всем версиям, кроме текущей)
+def get_history_keyboard(current: str, versions: list):
+    builder = InlineKeyboardBuilder()
+    buttons = [
+        InlineKeyboardButton(text=config['buttons_text']['inline']['rollback'].format(n=n), callback_data=f"rollback:{entry['file_hash'][:16]}")
+        for n, entry in enumerate(versions, 1) if entry['file_hash'] != current
+        ]
+    for start in range(0, len(buttons), 5):
+        builder.row(*buttons[start:start + 5])
+    builder.row(InlineKeyboardButton(text=config['buttons_text']['inline']['back_to_control'], callback_data="back_to_control"))
+    return builder.as_markup()
+
+# Функция для формирования списка версий расписания
+def format_history(current: str, versions: list) -> str:
+    if not versions:
+        return messages['history_empty']
+    return messages['history_list'].format(versions="\n".join(
+        messages['history_entry'].format(
+            mark="✅" if entry['file_hash'] == current else "▫️",
+            n=n,
+            saved_at=entry['saved_at'],
+            source=config['history']['source_names'].get(entry['source'], entry['source']),
+            first_day=entry['first_day'] or "-",
+            last_day=entry['last_day'] or "-",
+            days=entry['days']
+            )
+        for n, entry in enumerate(versions, 1)
+        ))
+
 # Функция для создания клавиатуры работы с разрешениями
 def get_permissions_keyboard(file_type: str):
     builder = InlineKeyboardBuilder()
@@ -199,9 +572,26 @@ def get_permissions_keyboard(file_type: str):
         InlineKeyboardButton(text=config['buttons_text']['inline']['remove_id'], callback_data=f"remove_id:{file_type}"),
         InlineKeyboardButton(text=config['buttons_text']['inline']['list_ids'], callback_data=f"list_ids:{file_type}")
     )
+    builder.row(
+        InlineKeyboardButton(text=config['buttons_text']['inline']['bulk_add'], callback_data=f"bulk_add:{file_type}"),
+        InlineKeyboardButton(text=config['buttons_text']['inline']['bulk_remove'], callback_data=f"bulk_remove:{file_type}"),
+        InlineKeyboardButton(text=config['buttons_text']['inline']['export_ids'], callback_data=f"export_ids:{file_type}")
+    )
     builder.row(InlineKeyboardButton(text=config['buttons_text']['inline']['back_to_control'], callback_data="back_to_control"))
     return builder.as_markup()
 
+# Функция для создания клавиатуры листания списка ID
+def get_list_page_keyboard(file_type: str, page: int, pages: int):
+    builder = InlineKeyboardBuilder()
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text=config['buttons_text']['inline']['prev_page'], callback_data=f"list_ids:{file_type}:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text=config['buttons_text']['inline']['next_page'], callback_data=f"list_ids:{file_type}:{page + 1}"))
+    if buttons:
+        builder.row(*buttons)
+    return builder.as_markup()
+
 # Функция для создания клавиатуры отмены
 def get_cancel_keyboard():
     builder = InlineKeyboardBuilder()
@@ -213,7 +603,7 @@ def get_cancel_keyboard():
 async def control_panel(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "No username"
-    logger.info(config['logger_messages']['user_try_cp'].format(username=username, user_id=user_id))
+    logger.info(logger_messages['user_try_cp'].format(username=username, user_id=user_id))
 
     # Проверка, что пользователь является админом
     has_permission = await check_user_permission(bot, True, GROUP_ID, ADMINS_FILE, BLACKLIST_FILE, user_id, config)
@@ -226,9 +616,9 @@ async def control_panel(message: types.Message):
                 del user_states[user_id]
 
             keyboard = get_control_panel_keyboard()
-            await message.answer(config['messages']['control_panel'], reply_markup=keyboard)
+            await message.answer(messages['control_panel'], reply_markup=keyboard)
         else:
-            await message.answer(config["messages"]["no_access"])
+            await message.answer(messages["no_access"])
 
 # Обработчик callback-запросов
 @dp.callback_query()
@@ -246,7 +636,7 @@ async def handle_callbacks(callback: types.CallbackQuery):
     if data:
         has_permission = await check_user_permission(bot, True, GROUP_ID, ADMINS_FILE, BLACKLIST_FILE, user_id, config)
         if has_permission == "Banned":
-            logger.warning(config['logger_messages']['cp_banned'].format(username=username, user_id=user_id, action=data))
+            logger.warning(logger_messages['cp_banned'].format(username=username, user_id=user_id, action=data))
             await callback.answer(text=config['reactions']['banned'], show_alert=False)
         else:
             if has_permission: 
@@ -266,7 +656,7 @@ async def handle_callbacks(callback: types.CallbackQuery):
                             # Возвращаемся к работе с разрешениями для конкретного файла
                             keyboard = get_permissions_keyboard(state['file_type'])
                             await message.edit_text(
-                                config['messages']['select_action'].\
+                                messages['select_action'].\
                                 format(pt=permission_text), 
                                 reply_markup=keyboard,
                                 parse_mode=ParseMode.MARKDOWN
@@ -276,13 +666,13 @@ async def handle_callbacks(callback: types.CallbackQuery):
                         action_logged = "replace_file"
                         # Возвращаемся к панели управления
                         keyboard = get_control_panel_keyboard()
-                        await message.edit_text(config['messages']['control_panel'], reply_markup=keyboard)
+                        await message.edit_text(messages['control_panel'], reply_markup=keyboard)
                         waiting_for_file[user_id] = False
 
                     else:
                         # Если состояние не сохранено, возвращаемся к панели управления
                         keyboard = get_control_panel_keyboard()
-                        await message.edit_text(config['messages']['control_panel'], reply_markup=keyboard)
+                        await message.edit_text(messages['control_panel'], reply_markup=keyboard)
                         waiting_for_file[user_id] = False
                         if user_id in user_messages:
                             user_messages[user_id]['message_to_delete'] = None
@@ -291,7 +681,7 @@ async def handle_callbacks(callback: types.CallbackQuery):
                     if user_id in user_messages:
                         user_messages[user_id]['message_to_delete'] = None
 
-                    logger.info(config['logger_messages']['act_cancel'].format(
+                    logger.info(logger_messages['act_cancel'].format(
                         username=username,
                         user_id=user_id,
                         action=action_logged
@@ -301,33 +691,88 @@ async def handle_callbacks(callback: types.CallbackQuery):
                     return
 
                 if data in ["dummy1", "dummy2"]:
-                    logger.info(config['logger_messages']['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
+                    logger.info(logger_messages['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
                     await callback.answer(config['callback_answers'][data], show_alert=True)
 
                 # Обработка нажатий на панели управления
                 if data == "replace_file":
-                    logger.info(config['logger_messages']['act_rf'].format(username=username, user_id=user_id))
+                    logger.info(logger_messages['act_rf'].format(username=username, user_id=user_id))
                     # Переходим в режим ожидания файла
                     waiting_for_file[user_id] = True
                     keyboard = get_cancel_keyboard()
-                    send_message = await message.edit_text(config["messages"]["send_file_prompt"], reply_markup=keyboard)
+                    send_message = await message.edit_text(messages["send_file_prompt"], reply_markup=keyboard)
                     send_message
                     user_messages[user_id]['message_to_delete'] = send_message.message_id
 
                 elif data == "update_schedule":
-                    logger.info(config['logger_messages']['act_upd'].format(username=username, user_id=user_id))
+                    logger.info(logger_messages['act_upd'].format(username=username, user_id=user_id))
                     # Обновляем расписание
-                    result = await download_schedule(SCHEDULE_FILE, config)
+                    # Ответ на callback должен уйти в течение нескольких секунд, поэтому загрузка ограничена по времени
+                    started = datetime.now().timestamp()
+                    result = await download_schedule(SCHEDULE_FILE, config, deadline=config['fetch']['manual_deadline'], history_dir=HISTORY_DIR)
                     if result:
-                        logger.info(config['logger_messages']['upd_successful'].format(username=username, user_id=user_id))
+                        logger.info(logger_messages['upd_successful'].format(username=username, user_id=user_id))
                         await callback.answer(config['callback_answers']['url_parsed'], show_alert=True)
                     else:
-                        logger.warning(config['logger_messages']['upd_unsuccessful'].format(username=username, user_id=user_id))
-                        await callback.answer(config['callback_answers']['url_unparsed'], show_alert=True)
-                    await callback.answer()
+                        logger.warning(logger_messages['upd_unsuccessful'].format(username=username, user_id=user_id))
+                        breaker = get_breaker_state(config['url_parser']['schedule_page_url'], config)
+                        if breaker['state'] == 'open':
+                            await callback.answer(config['callback_answers']['source_unavailable'].format(retry_in=breaker['retry_in']), show_alert=True)
+                        elif download_blocked_since(HISTORY_DIR, started):
+                            await callback.answer(config['callback_answers']['url_rolled_back'], show_alert=True)
+                        else:
+                            await callback.answer(config['callback_answers']['url_unparsed'], show_alert=True)
+                    # На callback уже ответили - повторный ответ Bot API отклоняет
+                    return
+
+                elif data == "source_status":
+                    logger.info(logger_messages['act_button'].format(username=username, user_id=user_id, button=data))
+                    breaker = get_breaker_state(config['url_parser']['schedule_page_url'], config)
+                    last_success = breaker['last_success'].strftime('%d.%m %H:%M') if breaker['last_success'] else "-"
+                    await callback.answer(
+                        config['callback_answers']['source_status'].format(
+                            host=breaker['host'],
+                            state=config['breaker_states'][breaker['state']],
+                            failures=breaker['failures'],
+                            retry_in=breaker['retry_in'],
+                            last_success=last_success,
+                            last_error=(breaker['last_error'] or "-")[:60]
+                            ),
+                        show_alert=True
+                        )
+                    return
+
+                elif data == "history":
+                    logger.info(logger_messages['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
+                    current, versions = list_versions(HISTORY_DIR)
+                    await message.edit_text(format_history(current, versions), reply_markup=get_history_keyboard(current, versions))
+
+                elif data.startswith("rollback:"):
+                    file_hash = data.split(":", 1)[1]
+                    current, versions = list_versions(HISTORY_DIR)
+                    if current and current.startswith(file_hash):
+                        await callback.answer(config['callback_answers']['rollback_current'], show_alert=True)
+                    else:
+                        # Откат не скачивает и не разбирает книгу заново: сохранённая разобранная форма сразу становится текущей
+                        entry = await asyncio.to_thread(rollback, HISTORY_DIR, SCHEDULE_FILE, file_hash, config)
+                        if entry is None:
+                            logger.warning(logger_messages['rollback_failed'].format(username=username, user_id=user_id, file_hash=file_hash))
+                            await callback.answer(config['callback_answers']['rollback_failed'], show_alert=True)
+                        else:
+                            logger.info(logger_messages['act_rollback'].format(username=username, user_id=user_id, file_hash=file_hash))
+                            await callback.answer(
+                                config['callback_answers']['rollback_done'].format(
+                                    saved_at=entry['saved_at'], first_day=entry['first_day'] or "-", last_day=entry['last_day'] or "-"
+                                    ),
+                                show_alert=True
+                                )
+                            current, versions = list_versions(HISTORY_DIR)
+                            await message.edit_text(format_history(current, versions), reply_markup=get_history_keyboard(current, versions))
+                    # На callback уже ответили - повторный ответ Bot API отклоняет
+                    return
 
                 elif data in ["permissions", "admins", "blacklist"]: 
-                    logger.info(config['logger_messages']['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
+                    logger.info(logger_messages['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
                     # Сохраняем тип файла в состоянии пользователя
                     file_type_map = {
                         "permissions": PERMISSIONS_FILE,
@@ -349,7 +794,7 @@ async def handle_callbacks(callback: types.CallbackQuery):
                     keyboard = get_permissions_keyboard(file_type)
                     permission_text = user_states[user_id]['permission_text']
                     await message.edit_text(
-                        config['messages']['select_action'].\
+                        messages['select_action'].\
                         format(pt=permission_text), 
                         reply_markup=keyboard,
                         parse_mode=ParseMode.MARKDOWN
@@ -372,7 +817,7 @@ async def handle_callbacks(callback: types.CallbackQuery):
                     config['buttons_text']['inline']['admins'] if file_type == "admins" else \
                     config['buttons_text']['inline']['blacklist']
 
-                    logger.info(config['logger_messages']['act_edit_permissions'].format(username=username, user_id=user_id, action=f"{permission_text}|{action_type}"))
+                    logger.info(logger_messages['act_edit_permissions'].format(username=username, user_id=user_id, action=f"{permission_text}|{action_type}"))
 
                     user_states[user_id] = {
                         'state': 'waiting_for_id',
@@ -382,10 +827,10 @@ async def handle_callbacks(callback: types.CallbackQuery):
                         'permission_text': permission_text
                     }
 
-                    action_text = config['messages']['adding'] if action == "add" else config['messages']['deleting']
+                    action_text = messages['adding'] if action == "add" else messages['deleting']
                     keyboard = get_cancel_keyboard()
                     edit_message = await message.edit_text(
-                        config['messages']['enter_id'].\
+                        messages['enter_id'].\
                         format(act=action_text, pt=permission_text), 
                         reply_markup=keyboard,
                         parse_mode=ParseMode.MARKDOWN
@@ -394,8 +839,11 @@ async def handle_callbacks(callback: types.CallbackQuery):
                     user_messages[user_id]['message_to_delete'] = edit_message.message_id
 
                 elif data.startswith("list_ids:"):
-                    # Показываем содержимое файла
-                    file_type = data.split(":")[1]
+                    # Показываем содержимое файла постранично: list_ids:<тип> - первая страница новым сообщением,
+                    # list_ids:<тип>:<страница> - листание в том же сообщении
+                    parts = data.split(":")
+                    file_type = parts[1]
+                    page = int(parts[2]) if len(parts) > 2 else 0
                     file_path_map = {
                         "permissions": PERMISSIONS_FILE,
                         "admins": ADMINS_FILE,
@@ -408,26 +856,78 @@ async def handle_callbacks(callback: types.CallbackQuery):
                         config['buttons_text']['inline']['blacklist']
                     
                     try:
-                        with open(file_path, 'r') as f:
-                            content = f.read()
+                        page_size = config['access_lists']['page_size']
+                        ids, total = read_ids_page(file_path, page, page_size)
+                        pages = max(1, -(-total // page_size))
+                        content = "\n".join(ids) if ids else "Файл пуст"
+
+                        logger.info(logger_messages['act_get_list_ids'].format(username=username, user_id=user_id, pt=permission_text))
+                        text = messages['permissions_list'].format(pt=permission_text, c=content, page=page + 1, pages=pages, total=total)
+                        keyboard = get_list_page_keyboard(file_type, page, pages)
+                        if len(parts) > 2:
+                            await message.edit_text(text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+                        else:
+                            await message.answer(text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+                    except FileNotFoundError:
+                        logger.error(logger_messages['act_get_list_ids_error'].format(username=username, user_id=user_id, pt=permission_text, file=file_type))
+                        await callback.answer(config['callback_answers']['perm_file_not_found'].format(file_type=file_type), show_alert=True)
 
-                        if not content:
-                            content = "Файл пуст"
+                elif data.startswith(("bulk_add:", "bulk_remove:")):
+                    # Массовое добавление/удаление: ждём .txt/.csv файл со списком ID
+                    action_type, file_type = data.split(":")
+                    action = "add" if action_type == "bulk_add" else "remove"
+                    file_path_map = {
+                        "permissions": PERMISSIONS_FILE,
+                        "admins": ADMINS_FILE,
+                        "blacklist": BLACKLIST_FILE
+                    }
+                    permission_text = config['buttons_text']['inline'][file_type]
 
-                        logger.info(config['logger_messages']['act_get_list_ids'].format(username=username, user_id=user_id, pt=permission_text))
-                        await message.answer(
-                            config['messages']['permissions_list'].format(pt=permission_text, c=content),
-                            parse_mode=ParseMode.MARKDOWN
+                    logger.info(logger_messages['act_edit_permissions'].format(username=username, user_id=user_id, action=f"{permission_text}|{action_type}"))
+
+                    user_states[user_id] = {
+                        'state': 'waiting_for_ids_file',
+                        'action': action,
+                        'file_type': file_type,
+                        'file_path': file_path_map[file_type],
+                        'permission_text': permission_text
+                    }
+
+                    action_text = messages['adding'] if action == "add" else messages['deleting']
+                    edit_message = await message.edit_text(
+                        messages['send_ids_file'].format(act=action_text, pt=permission_text),
+                        reply_markup=get_cancel_keyboard(),
+                        parse_mode=ParseMode.MARKDOWN
                         )
-                    except FileNotFoundError:
-                        logger.error(config['logger_messages']['act_get_list_ids_error'].format(username=username, user_id=user_id, pt=permission_text, file=file_type))
+                    user_messages[user_id]['message_to_delete'] = edit_message.message_id
+
+                elif data.startswith("export_ids:"):
+                    # Выгружаем файл доступа документом
+                    file_type = data.split(":")[1]
+                    file_path_map = {
+                        "permissions": PERMISSIONS_FILE,
+                        "admins": ADMINS_FILE,
+                        "blacklist": BLACKLIST_FILE
+                    }
+                    file_path = file_path_map[file_type]
+                    permission_text = config['buttons_text']['inline'][file_type]
+
+                    if os.path.exists(file_path):
+                        logger.info(logger_messages['act_export_ids'].format(username=username, user_id=user_id, pt=permission_text))
+                        await message.answer_document(
+                            FSInputFile(file_path, filename=f"{file_type}.txt"),
+                            caption=messages['ids_exported'].format(pt=permission_text),
+                            parse_mode=ParseMode.MARKDOWN
+                            )
+                    else:
+                        logger.error(logger_messages['act_get_list_ids_error'].format(username=username, user_id=user_id, pt=permission_text, file=file_type))
                         await callback.answer(config['callback_answers']['perm_file_not_found'].format(file_type=file_type), show_alert=True)
 
                 elif data == "back_to_control":
-                    logger.info(config['logger_messages']['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
+                    logger.info(logger_messages['act_button'].format(username=username, user_id=user_id, button=config['buttons_text']['inline'][data]))
                     # Возвращаемся к панели управления
                     keyboard = get_control_panel_keyboard()
-                    await message.edit_text(config['messages']['control_panel'], reply_markup=keyboard)
+                    await message.edit_text(messages['control_panel'], reply_markup=keyboard)
 
                     # Очищаем состояние пользователя и message_to_delete
                     if user_id in user_states:
@@ -439,9 +939,60 @@ async def handle_callbacks(callback: types.CallbackQuery):
                 await callback.answer()
 
             else:
-                logger.warning(config['logger_messages']['cp_no_permission'].format(username=username, user_id=user_id, action=data))
+                logger.warning(logger_messages['cp_no_permission'].format(username=username, user_id=user_id, action=data))
                 await callback.answer(text=config['callback_answers']['no_access'], show_alert=True)
 
+# Функция обработки файла со списком ID (массовое добавление/удаление)
+async def handle_ids_file(message: types.Message, state: dict):
+    user_id = message.from_user.id
+    username = message.from_user.username
+    chat_id = message.chat.id
+    document = message.document
+    permission_text = state['permission_text']
+
+    extension = Path(document.file_name or "").suffix.lower()
+    if extension not in (".txt", ".csv") or (document.file_size or 0) > config['access_lists']['max_file_size']:
+        logger.warning(logger_messages['ids_file_invalid'].format(username=username, user_id=user_id, file=document.file_name))
+        run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
+        send_message = await message.answer(
+            messages['ids_file_invalid'].format(max_mb=f"{config['access_lists']['max_file_size'] / 1048576:g}"),
+            reply_markup=get_cancel_keyboard()
+            )
+        user_messages[user_id]['message_to_delete'] = send_message.message_id
+        return
+
+    file = await bot.get_file(document.file_id)
+    content = (await bot.download_file(file.file_path)).getvalue().decode('utf-8-sig', errors='replace')
+    ids, invalid = parse_ids(content)
+    result = await manage_user_ids(state['file_path'], ids, state['action'], config)
+
+    run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
+    if result is None:
+        send_message = await message.answer(messages['id_validate_error'], reply_markup=get_cancel_keyboard())
+        user_messages[user_id]['message_to_delete'] = send_message.message_id
+        return
+
+    action_text = messages['bulk_added'] if state['action'] == "add" else messages['bulk_deleted']
+    logger.info(logger_messages['ids_bulk_success'].format(
+        username=username, user_id=user_id, act=action_text, pt=permission_text,
+        changed=result['changed'], skipped=result['skipped'], invalid=invalid
+        ))
+    await message.answer(
+        messages['ids_bulk_result'].format(
+            act=action_text, pt=permission_text,
+            changed=result['changed'], skipped=result['skipped'], invalid=invalid
+            ),
+        parse_mode=ParseMode.MARKDOWN
+        )
+    user_messages[user_id]['message_to_delete'] = None
+
+    await message.answer(
+        messages['select_action'].format(pt=permission_text),
+        reply_markup=get_permissions_keyboard(state['file_type']),
+        parse_mode=ParseMode.MARKDOWN
+        )
+    del user_states[user_id]
+
 # Обработчик документов (для замены файла расписания)
 @dp.message(F.document)
 async def handle_document(message: types.Message):
@@ -453,18 +1004,30 @@ async def handle_document(message: types.Message):
     if user_id not in user_messages:
         user_messages[user_id] = {'message_to_delete': None}
 
-    if waiting_for_file.get(user_id, False):
+    state = user_states.get(user_id, {})
+    if state.get('state') == 'waiting_for_ids_file':
+        await handle_ids_file(message, state)
+
+    elif waiting_for_file.get(user_id, False):
         if message.document:
-            logger.info(config['logger_messages']['rf_successful'].format(username=username, user_id=user_id))
             file = await bot.get_file(message.document.file_id)
-            file_path = Path(SCHEDULE_FILE)
-            await bot.download_file(file.file_path, file_path)
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
-            await message.answer(config["messages"]["file_received"], reply_markup=types.ReplyKeyboardRemove())
+            content = (await bot.download_file(file.file_path)).getvalue()
+            # Файл заменяется только после проверки, прежняя версия остаётся в истории
+            schedule = await install_schedule(SCHEDULE_FILE, content, config, "upload", HISTORY_DIR)
+            # Удаление подсказки идёт параллельно с ответами, порядок ответов сохраняется
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
+            if schedule is None:
+                logger.warning(logger_messages['rf_rejected'].format(username=username, user_id=user_id, file=message.document.file_name))
+                send_message = await message.answer(messages['file_rejected'], reply_markup=get_cancel_keyboard())
+                user_messages[user_id]['message_to_delete'] = send_message.message_id
+                return
+
+            logger.info(logger_messages['rf_successful'].format(username=username, user_id=user_id))
+            await message.answer(messages["file_received"], reply_markup=types.ReplyKeyboardRemove())
 
             # Возвращаем панели управления
             keyboard = get_control_panel_keyboard()
-            await message.answer(config['messages']['control_panel'], reply_markup=keyboard)
+            await message.answer(messages['control_panel'], reply_markup=keyboard)
 
             waiting_for_file[user_id] = False
             if user_id in user_states:
@@ -472,21 +1035,21 @@ async def handle_document(message: types.Message):
             user_messages[user_id] = {'message_to_delete': None}
 
         else:
-            logger.warning(config['logger_messages']['rf_not_file'].format(username=username, user_id=user_id))
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
+            logger.warning(logger_messages['rf_not_file'].format(username=username, user_id=user_id))
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
             keyboard = get_cancel_keyboard()
-            send_message = await message.answer(config["messages"]["send_file_prompt"], reply_markup=keyboard)
+            send_message = await message.answer(messages["send_file_prompt"], reply_markup=keyboard)
             send_message
             user_messages[user_id]['message_to_delete'] = send_message.message_id
 
     else:
-        logger.warning(config['logger_messages']['user_send_file_only'].format(username=username, user_id=user_id))
+        logger.warning(logger_messages['user_send_file_only'].format(username=username, user_id=user_id))
         has_permission = await check_user_permission(bot, True, GROUP_ID, ADMINS_FILE, BLACKLIST_FILE, user_id, config)
         if has_permission == "Banned" or not has_permission:
             pass
         else:
             await message.answer(
-                config["messages"]["send_file_first"].format(replace_button=config['buttons_text']['inline']['replace_file']),
+                messages["send_file_first"].format(replace_button=config['buttons_text']['inline']['replace_file']),
                 parse_mode=ParseMode.HTML
                 )
 
@@ -507,10 +1070,10 @@ async def handle_text_message(message: types.Message):
 
         # Проверяем валидность введенного ID
         if not user_input.isdigit() or len(user_input) < 9 or len(user_input) > 11:
-            logger.warning(config['logger_messages']['user_send_invalid_id'].format(username=username, user_id=user_id, uid=user_input))
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
+            logger.warning(logger_messages['user_send_invalid_id'].format(username=username, user_id=user_id, uid=user_input))
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
             keyboard = get_cancel_keyboard()
-            send_message = await message.answer(config['messages']['invalid_id'], reply_markup=keyboard)
+            send_message = await message.answer(messages['invalid_id'], reply_markup=keyboard)
             send_message
             user_messages[user_id]['message_to_delete'] = send_message.message_id
             return
@@ -519,7 +1082,7 @@ async def handle_text_message(message: types.Message):
         file_path = state['file_path']
         user_id_to_manage = int(user_input)
 
-        logger.info(config['logger_messages']['user_send_valid_id'].format(username=username, user_id=user_id, uid=user_id_to_manage))
+        logger.info(logger_messages['user_send_valid_id'].format(username=username, user_id=user_id, uid=user_id_to_manage))
 
         # Выполняем действие с файлом
         result = await manage_user_id(file_path, user_id_to_manage, action, config)
@@ -532,11 +1095,11 @@ async def handle_text_message(message: types.Message):
         permission_text = permission_text_map.get(state['file_type']) # , "файла"
 
         if result == "success":
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
-            action_text = config['messages']['added'] if action == "add" else config['messages']['deleted']
-            logger.info(config['logger_messages']['id_success'].format(uid=user_id_to_manage, act=action_text, pt=permission_text))
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
+            action_text = messages['added'] if action == "add" else messages['deleted']
+            logger.info(logger_messages['id_success'].format(uid=user_id_to_manage, act=action_text, pt=permission_text))
             await message.answer(
-                config['messages']['id_validated'].\
+                messages['id_validated'].\
                 format(uid=user_id_to_manage, act=action_text, pt=permission_text), 
                 parse_mode=ParseMode.MARKDOWN
                 )
@@ -544,7 +1107,7 @@ async def handle_text_message(message: types.Message):
 
             keyboard = get_permissions_keyboard(state['file_type'])
             await message.answer(
-                config['messages']['select_action'].\
+                messages['select_action'].\
                 format(pt=permission_text), 
                 reply_markup=keyboard,
                 parse_mode=ParseMode.MARKDOWN
@@ -552,11 +1115,11 @@ async def handle_text_message(message: types.Message):
             del user_states[user_id]
 
         elif result == "exists":
-            logger.warning(config['logger_messages']['id_exists'].format(uid=user_id_to_manage, pt=permission_text))
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
+            logger.warning(logger_messages['id_exists'].format(uid=user_id_to_manage, pt=permission_text))
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
             keyboard = get_cancel_keyboard()
             send_message = await message.answer(
-                config['messages']['id_exists'].\
+                messages['id_exists'].\
                 format(uid=user_id_to_manage, pt=permission_text), 
                 reply_markup=keyboard,
                 parse_mode=ParseMode.MARKDOWN
@@ -565,11 +1128,11 @@ async def handle_text_message(message: types.Message):
             user_messages[user_id]['message_to_delete'] = send_message.message_id
 
         elif result == "not_found":
-            logger.warning(config['logger_messages']['id_not_found'].format(uid=user_id_to_manage, pt=permission_text))
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
+            logger.warning(logger_messages['id_not_found'].format(uid=user_id_to_manage, pt=permission_text))
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
             keyboard = get_cancel_keyboard()
             send_message = await message.answer(
-                config['messages']['id_not_found'].\
+                messages['id_not_found'].\
                 format(uid=user_id_to_manage, pt=permission_text), 
                 reply_markup=keyboard,
                 parse_mode=ParseMode.MARKDOWN
@@ -578,10 +1141,10 @@ async def handle_text_message(message: types.Message):
             user_messages[user_id]['message_to_delete'] = send_message.message_id
 
         else:
-            await bot.delete_message(chat_id, user_messages[user_id]['message_to_delete'])
+            run_in_background(bot.delete_message(chat_id, user_messages[user_id]['message_to_delete']))
             keyboard = get_cancel_keyboard()
             send_message = await message.answer(
-                config['messages']['id_validate_error'], 
+                messages['id_validate_error'], 
                 reply_markup=keyboard
                 )
             send_message
@@ -594,15 +1157,88 @@ async def handle_text_message(message: types.Message):
         elif message.text == config['buttons_text']['reply']['tomorrow']:
             await tomorrow_command(message)
 
+# Функция постановки рассылки в группу и прогрева в планировщик (повторный вызов переставляет задания)
+def schedule_group_jobs():
+    if config['scheduler']['is_activated'] is True: # Если в конфиге False, то рассылка в группу не будет работать
+        # 00 22 * * 0,1,2,3,4,6 = 22:00 по понедельникам-пятницам и воскресеньям
+        scheduler.add_job("broadcast", cron_next(config['scheduler']['settings']), send_schedule)
+        # Прогрев за prewarm_minutes до рассылки
+        scheduler.add_job(
+            "prewarm",
+            cron_next(config['scheduler']['settings'], -timedelta(minutes=config['scheduler']['prewarm_minutes'])),
+            prewarm_schedule
+            )
+        logger.info(logger_messages['scheduler_started'])
+    else:
+        scheduler.remove_job("broadcast")
+        scheduler.remove_job("prewarm")
+
+# Функция настройки проверки файла конфига. После отключения файл больше не проверяется,
+# поэтому снова включить перезагрузку можно только перезапуском бота
+def schedule_config_reload():
+    if config['config_reload']['is_activated'] is True:
+        # Интервал берётся из текущего конфига при каждом запуске задания
+        scheduler.add_job("config_reload", lambda after: after + timedelta(seconds=config['config_reload']['interval']), check_config)
+    else:
+        scheduler.remove_job("config_reload")
+
+# Функция применения перезагруженного конфига. Глобальные ссылки подменяются целиком,
+# поэтому обработчик, уже начавший работу, дорабатывает со старой версией конфига
+def apply_config(old_config: dict, new_config: dict, changed: set):
+    global config, messages, logger_messages, GROUP_ID, delivery_semaphore
+    config = new_config
+    messages = config['messages']
+    logger_messages = config['logger_messages']
+    GROUP_ID = config['group_id']
+    scheduler.config = config
+
+    if 'scheduler' in changed:
+        schedule_group_jobs()
+    if 'config_reload.is_activated' in changed:
+        schedule_config_reload()
+    if 'scheduler.delivery_concurrency' in changed:
+        delivery_semaphore = asyncio.Semaphore(config['scheduler']['delivery_concurrency'])
+
+    # Сбрасываются только кэши, зависящие от изменившихся разделов.
+    # Разбор книги и поисковый индекс привязаны к версии расписания, в которую входят настройки schedule_parser
+    if 'occupancy' in changed:
+        invalidate_occupancy_index()
+    if changed & {'occupancy', 'calendar'}:
+        invalidate_feeds()
+    if 'schedule_parser' in changed:
+        # С новыми настройками книга разбирается сразу, а не на первом запросе пользователя
+        run_in_background(get_schedule(SCHEDULE_FILE, config))
+
+# Функция проверки файла конфига (задание планировщика)
+async def check_config():
+    result = config_service.reload_if_changed()
+    if result is not None:
+        apply_config(*result)
+
+# Функция добавления текущего файла расписания в историю версий (при первом запуске история пуста)
+async def record_initial_version():
+    schedule = await get_schedule(SCHEDULE_FILE, config)
+    await asyncio.to_thread(record_current, HISTORY_DIR, SCHEDULE_FILE, schedule, config)
+
 async def main():
     # Настройка планировщика задач
-    if config['scheduler']['is_activated'] is True: # Если в конфиге False, то планировщик не будет работать
-        @crontab(config['scheduler']['settings'])  # 00 22 * * 0,1,2,3,4,6 = 22:00 по понедельникам-пятницам и воскресеньям
-        async def scheduled_task():
-            await send_schedule()
-        logger.info(config['logger_messages']['scheduler_started'])
-
-    await dp.start_polling(bot)
+    schedule_group_jobs()
+    schedule_config_reload()
+
+    # Персональные рассылки подписчиков
+    for user_id in subscriptions:
+        schedule_subscription(user_id)
+    scheduler.start()
+    run_in_background(record_initial_version())
+
+    # HTTP-сервер с календарными лентами групп
+    # Сервер получает конфиг через функцию: после перезагрузки конфига он сразу работает с новыми настройками
+    calendar_runner = await start_calendar_server(SCHEDULE_FILE, lambda: config) if config['calendar']['is_activated'] else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if calendar_runner is not None:
+            await calendar_runner.cleanup()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import os
+import re
+from aiohttp import web
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from urllib.parse import quote
+
+from modules.schedule_parser import get_schedule
+
+logger = logging.getLogger(__name__)
+
+# Готовые ленты для текущей версии расписания: {группа: {'body': bytes, 'etag': str}}
+_feed_cache = {'version': None, 'feeds': {}}
+
+# Время пары в колонке B: "09:00-10:30", "9.00 - 10.30"
+TIME_RANGE_PATTERN = re.compile(r'(\d{1,2})[:.](\d{2})\s*[-–—]\s*(\d{1,2})[:.](\d{2})')
+
+def _escape(text: str) -> str:
+    """Экранирование текста по RFC 5545"""
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def _fold(line: str) -> str:
+    """Перенос строк длиннее 75 байт (продолжение начинается с пробела)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        size = min(len(encoded), 75 if not parts else 74)
+        # Не разрезаем многобайтовый символ
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return "\r\n ".join(parts)
+
+def _format_utc(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def build_group_calendar(schedule: dict, group: str, config: dict, updated_at: datetime) -> str:
+    """
+    Строит iCalendar-ленту группы: каждое занятие - VEVENT со временем пары из колонки B.
+
+    Args:
+        schedule (dict): Разобранное расписание (см. schedule_parser.read_schedule_file)
+        group (str): Название группы
+        config (dict): Конфигурация
+        updated_at (datetime): Время изменения файла расписания (DTSTAMP событий)
+
+    Returns:
+        str: Содержимое .ics файла
+    """
+    settings = config['calendar']
+    tz = timezone(timedelta(hours=settings['utc_offset']))
+    skip_subjects = {subject.lower() for subject in settings['skip_subjects']}
+    ignore_rooms = {room.upper() for room in config['occupancy']['ignore_rooms']}
+    # DTSTAMP - время изменения файла, а не генерации: иначе после перезапуска бота менялся бы ETag
+    stamp = _format_utc(updated_at)
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//elapoly-schedule-bot//schedule//RU",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(settings['calendar_name'].format(group=group))}",
+        f"X-PUBLISHED-TTL:PT{max(1, settings['cache_max_age'] // 60)}M",
+    ]
+
+    seen_dates = set()
+    for day in schedule['days']:
+        entries = day['groups'].get(group)
+        year = day['year'] or datetime.now().year
+        if entries is None or (year, day['month'], day['day']) in seen_dates:
+            continue
+        seen_dates.add((year, day['month'], day['day']))
+
+        for entry in entries:
+            match = TIME_RANGE_PATTERN.search(entry['time'] or "")
+            subjects = [subject.strip() for subject in entry['subjects'] if subject.strip()]
+            if not match or not subjects or all(subject.lower() in skip_subjects for subject in subjects):
+                continue
+
+            start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+            start = datetime(year, day['month'], day['day'], start_hour, start_minute, tzinfo=tz)
+            end = datetime(year, day['month'], day['day'], end_hour, end_minute, tzinfo=tz)
+            rooms = [room for room in entry['rooms'] if room.strip().upper() not in ignore_rooms]
+            uid = hashlib.sha1(f"{group}|{start:%Y%m%d}|{entry['slot']}".encode('utf-8')).hexdigest()
+
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{uid}@elapoly-schedule-bot",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{_format_utc(start)}",
+                f"DTEND:{_format_utc(end)}",
+                f"SUMMARY:{_escape(', '.join(subjects))}",
+            ]
+            if rooms:
+                lines.append(f"LOCATION:{_escape(', '.join(rooms))}")
+            lines += [
+                f"DESCRIPTION:{_escape(chr(10).join(entry['lines']))}",
+                "END:VEVENT",
+            ]
+
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+def get_group_feed(schedule: dict, group: str, config: dict, updated_at: datetime) -> Optional[dict]:
+    """
+    Лента группы для версии расписания: генерируется один раз на версию, дальше отдаётся из кэша.
+
+    Returns:
+        Optional[dict]: {'body': bytes, 'etag': str} или None, если группы нет в расписании
+    """
+    if _feed_cache['version'] != schedule['version']:
+        _feed_cache['feeds'] = {}
+        _feed_cache['version'] = schedule['version']
+
+    feed = _feed_cache['feeds'].get(group)
+    if feed is None:
+        if not any(group in day['groups'] for day in schedule['days']):
+            return None
+        body = build_group_calendar(schedule, group, config, updated_at).encode('utf-8')
+        feed = {'body': body, 'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"'}
+        _feed_cache['feeds'][group] = feed
+        logger.info(config['logger_messages']['calendar_generated'].format(group=group, version=schedule['version']))
+    return feed
+
+def invalidate_feeds():
+    """Сбрасывает готовые ленты (при изменении настроек calendar/occupancy)"""
+    _feed_cache.update(version=None, feeds={})
+
+def feed_url(group: str, config: dict) -> str:
+    """Публичная ссылка на ленту группы"""
+    return f"{config['calendar']['public_url'].rstrip('/')}/calendar/{quote(group)}.ics"
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (слабое сравнение, как требует RFC 9110 для этого заголовка)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def make_calendar_app(schedule_file: str, get_config: Callable[[], dict]) -> web.Application:
+    """
+    Args:
+        schedule_file (str): Путь к файлу с расписанием
+        get_config (Callable[[], dict]): Возвращает текущий конфиг - он читается на каждый запрос, чтобы сервер
+            видел перезагруженные настройки (и разбирал расписание с теми же настройками, что и бот)
+    """
+    async def handle_feed(request: web.Request) -> web.StreamResponse:
+        config = get_config()
+        schedule = await get_schedule(schedule_file, config)
+        if schedule is None:
+            raise web.HTTPServiceUnavailable()
+
+        updated_at = datetime.fromtimestamp(os.stat(schedule_file).st_mtime, timezone.utc)
+        feed = get_group_feed(schedule, request.match_info['group'], config, updated_at)
+        if feed is None:
+            raise web.HTTPNotFound()
+
+        headers = {'ETag': feed['etag'], 'Cache-Control': f"public, max-age={config['calendar']['cache_max_age']}"}
+        if _etag_matches(request.headers.get('If-None-Match'), feed['etag']):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=feed['body'], content_type='text/calendar', charset='utf-8', headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/calendar/{group}.ics', handle_feed)
+    return app
+
+async def start_calendar_server(schedule_file: str, get_config: Callable[[], dict]) -> web.AppRunner:
+    """Запускает HTTP-сервер с лентами; остановка - await runner.cleanup()"""
+    config = get_config()
+    runner = web.AppRunner(make_calendar_app(schedule_file, get_config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, config['calendar']['host'], config['calendar']['port']).start()
+    logger.info(config['logger_messages']['calendar_started'].format(host=config['calendar']['host'], port=config['calendar']['port']))
+    return runner
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import re
+from cronsim import CronSim
+from datetime import datetime
+from string import Formatter
+from typing import Optional
+
+from modules.subscriptions import MODES, parse_time
+
+logger = logging.getLogger(__name__)
+
+# Разделы с шаблонами, которые проверяются при загрузке конфига
+TEMPLATE_SECTIONS = ("messages", "logger_messages", "callback_answers")
+
+# Параметры, которые применяются только после перезапуска бота
+RESTART_REQUIRED = ("bot_token", "api_server", "files", "calendar.is_activated", "calendar.host", "calendar.port")
+
+_formatter = Formatter()
+
+def check_template(text: str):
+    """
+    Проверяет шаблон сообщения, чтобы ошибка в нём обнаружилась при загрузке конфига, а не при отправке сообщения.
+    Вызывает ValueError, если шаблон не разберёт str.format.
+    """
+    for _, field, spec, conversion in _formatter.parse(text):
+        if conversion not in (None, 'r', 's', 'a'):
+            raise ValueError(f"неизвестное преобразование !{conversion}")
+        if spec:
+            check_template(spec)  # В спецификаторе могут быть вложенные поля: {value:{width}}
+
+def template_fields(text: str) -> set:
+    """Имена полей, которые шаблон берёт из аргументов format: '{user.id} {x:{width}}' -> {'user', 'x', 'width'}"""
+    fields = set()
+    for _, field, spec, _ in _formatter.parse(text):
+        if field is not None:
+            fields.add(re.match(r'[^.\[]*', field).group())
+        if spec:
+            fields |= template_fields(spec)
+    return fields
+
+def check_templates(config: dict):
+    """Проверяет все шаблоны конфига (ValueError с названием первого некорректного шаблона)"""
+    for section in TEMPLATE_SECTIONS:
+        for name, text in config[section].items():
+            try:
+                check_template(text)
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"{section}.{name}: {e}") from e
+
+def load_config(config_path: str) -> dict:
+    with open(config_path, 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    check_templates(config)
+    return config
+
+def validate_config(new: dict, current: dict) -> list:
+    """
+    Проверяет новый конфиг перед применением.
+
+    Returns:
+        list: Описания ошибок (пустой список - конфиг можно применять)
+    """
+    errors = []
+
+    # Структура должна совпадать с работающим конфигом: те же ключи и типы значений
+    def compare(old: dict, value: dict, path: str):
+        for key, old_value in old.items():
+            key_path = f"{path}.{key}" if path else key
+            if key not in value:
+                errors.append(f"{key_path}: отсутствует")
+            elif isinstance(old_value, dict):
+                if not isinstance(value[key], dict):
+                    errors.append(f"{key_path}: ожидается объект")
+                elif key_path not in TEMPLATE_SECTIONS:  # Шаблоны проверяются отдельно
+                    compare(old_value, value[key], key_path)
+            elif isinstance(old_value, bool) != isinstance(value[key], bool) or \
+                    not isinstance(value[key], (int, float) if isinstance(old_value, (int, float)) else type(old_value)):
+                errors.append(f"{key_path}: ожидается {type(old_value).__name__}")
+    compare(current, new, "")
+
+    # Шаблоны: все, что используются ботом, на месте и корректно разбираются.
+    # Новые поля в шаблоне запрещены: код передаёт в format только поля текущей версии, и вызов упал бы с KeyError
+    for section in TEMPLATE_SECTIONS:
+        for name in current.get(section, {}):
+            if name not in new.get(section, {}):
+                errors.append(f"{section}.{name}: отсутствует")
+        for name, text in new.get(section, {}).items():
+            try:
+                check_template(text)
+            except (ValueError, TypeError, AttributeError) as e:
+                errors.append(f"{section}.{name}: {e}")
+                continue
+            if name in current.get(section, {}):
+                unknown = template_fields(text) - template_fields(current[section][name])
+                if unknown:
+                    errors.append(f"{section}.{name}: неизвестные поля {', '.join(sorted('{' + field + '}' for field in unknown))}")
+
+    if errors:
+        return errors
+
+    try:
+        next(CronSim(new['scheduler']['settings'], datetime.now()))
+    except Exception as e:
+        errors.append(f"scheduler.settings: {e}")
+    for mode in MODES:
+        if parse_time(str(new['scheduler']['delivery_times'].get(mode, ""))) is None:
+            errors.append(f"scheduler.delivery_times.{mode}: ожидается ЧЧ:ММ")
+    if new['scheduler']['delivery_concurrency'] < 1:
+        errors.append("scheduler.delivery_concurrency: должно быть больше 0")
+    if new['access_lists']['page_size'] < 1:
+        errors.append("access_lists.page_size: должно быть больше 0")
+    if new['history']['max_versions'] < 1:
+        errors.append("history.max_versions: должно быть больше 0")
+    return errors
+
+def changed_keys(old: dict, new: dict) -> set:
+    """Изменившиеся разделы и их параметры: {'scheduler', 'scheduler.settings', ...}"""
+    changed = set()
+    for key in old.keys() | new.keys():
+        if old.get(key) == new.get(key):
+            continue
+        changed.add(key)
+        if isinstance(old.get(key), dict) and isinstance(new.get(key), dict):
+            changed.update(f"{key}.{name}" for name in old[key].keys() | new[key].keys() if old[key].get(name) != new[key].get(name))
+    return changed
+
+class ConfigService:
+    """
+    Текущий конфиг и его перезагрузка без перезапуска бота.
+
+    Файл проверяется по stat (без чтения, пока не изменился). Новая версия применяется целиком
+    только после проверки; при ошибке продолжает работать предыдущая.
+    """
+
+    def __init__(self, config_path: str):
+        self.path = config_path
+        self.config = load_config(config_path)
+        self._stat = self._file_stat()
+
+    def _file_stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def reload_if_changed(self) -> Optional[tuple]:
+        """
+        Перечитывает конфиг, если файл изменился.
+
+        Returns:
+            Optional[tuple]: (старый конфиг, новый конфиг, изменившиеся ключи) или None, если применять нечего
+        """
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return None
+        self._stat = stat
+        current = self.config
+
+        try:
+            new = load_config(self.path)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.error(current['logger_messages']['config_invalid'].format(errors=repr(e)))
+            return None
+
+        errors = validate_config(new, current)
+        if errors:
+            logger.error(current['logger_messages']['config_invalid'].format(errors="; ".join(errors)))
+            return None
+
+        changed = changed_keys(current, new)
+        if not changed:
+            return None
+
+        restart_required = [key for key in RESTART_REQUIRED if key in changed]
+        if restart_required:
+            logger.warning(new['logger_messages']['config_restart_required'].format(keys=", ".join(restart_required)))
+
+        self.config = new
+        logger.info(new['logger_messages']['config_reloaded'].format(keys=", ".join(sorted(key for key in changed if "." not in key))))
+        return current, new, changed
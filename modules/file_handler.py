@@ -1,54 +1,246 @@
 import aiohttp
+import asyncio
+import hashlib
+import random
+import time
 from bs4 import BeautifulSoup
 import logging
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlsplit
+
+from modules.schedule_history import check_download, install_lock, record_version, write_atomic
+from modules.schedule_parser import read_schedule_file, store_schedule
 
 logger = logging.getLogger(__name__)
 
+# Состояние автомата (circuit breaker) для каждого хоста:
+# closed - запросы идут, open - хост недоступен, запросы не отправляются до истечения паузы,
+# half_open - пауза истекла, пропускается один пробный запрос
+_breakers = {}
+
+def _get_breaker(url: str) -> dict:
+    host = urlsplit(url).hostname
+    return _breakers.setdefault(host, {
+        'host': host,
+        'state': 'closed',
+        'failures': 0,
+        'opened_at': None,
+        'probe': False,
+        'last_error': None,
+        'last_success': None,
+    })
+
+def _breaker_allows(breaker: dict, config: dict) -> bool:
+    """Можно ли сейчас отправить запрос к хосту"""
+    if breaker['state'] == 'open':
+        if time.monotonic() - breaker['opened_at'] < config['fetch']['breaker_cooldown']:
+            return False
+        breaker['state'] = 'half_open'
+        logger.info(config['logger_messages']['breaker_half_open'].format(host=breaker['host']))
+    if breaker['state'] == 'half_open':
+        if breaker['probe']:
+            return False  # Пробный запрос уже выполняется
+        breaker['probe'] = True
+    return True
+
+def _breaker_success(breaker: dict, config: dict):
+    if breaker['state'] != 'closed':
+        logger.info(config['logger_messages']['breaker_closed'].format(host=breaker['host']))
+    breaker.update(state='closed', failures=0, probe=False, last_success=datetime.now())
+
+def _breaker_failure(breaker: dict, error: str, config: dict):
+    breaker['failures'] += 1
+    breaker['probe'] = False
+    breaker['last_error'] = error
+    if breaker['state'] == 'half_open' or breaker['failures'] >= config['fetch']['breaker_threshold']:
+        if breaker['state'] != 'open':
+            logger.warning(config['logger_messages']['breaker_opened'].format(
+                host=breaker['host'], failures=breaker['failures'], cooldown=config['fetch']['breaker_cooldown']))
+        breaker.update(state='open', opened_at=time.monotonic())
+
+def get_breaker_state(url: str, config: dict) -> dict:
+    """
+    Состояние автомата для хоста (для панели управления).
+
+    Returns:
+        dict: {'host', 'state', 'failures', 'retry_in' (секунд до пробного запроса), 'last_error', 'last_success'}
+    """
+    breaker = _get_breaker(url)
+    retry_in = 0
+    if breaker['state'] == 'open':
+        retry_in = max(0, round(config['fetch']['breaker_cooldown'] - (time.monotonic() - breaker['opened_at'])))
+    return {
+        'host': breaker['host'],
+        'state': breaker['state'],
+        'failures': breaker['failures'],
+        'retry_in': retry_in,
+        'last_error': breaker['last_error'],
+        'last_success': breaker['last_success'],
+    }
+
+async def fetch(session: aiohttp.ClientSession, url: str, config: dict) -> Optional[bytes]:
+    """
+    Загружает URL с таймаутом на каждый запрос и повторами с экспоненциальной задержкой (со случайным разбросом).
+
+    Запросы не отправляются, пока автомат хоста разомкнут - недоступный сайт не нагружается повторами.
+
+    Returns:
+        Optional[bytes]: Содержимое ответа или None, если загрузить не удалось
+    """
+    settings = config['fetch']
+    breaker = _get_breaker(url)
+    timeout = aiohttp.ClientTimeout(total=settings['timeout'], connect=settings['connect_timeout'])
+    attempts = settings['retries'] + 1
+
+    for attempt in range(attempts):
+        if not _breaker_allows(breaker, config):
+            logger.warning(config['logger_messages']['breaker_rejected'].format(host=breaker['host'], url=url))
+            return None
+
+        try:
+            async with session.get(url, ssl=False, timeout=timeout) as response:
+                if response.status == 200:
+                    content = await response.read()
+                    _breaker_success(breaker, config)
+                    return content
+                error = f"HTTP {response.status}"
+                retryable = response.status >= 500 or response.status == 429
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+            retryable = True
+        except asyncio.CancelledError:
+            # Загрузку прервали по общему ограничению времени - пробный запрос можно повторить позже
+            breaker['probe'] = False
+            raise
+
+        if retryable:
+            _breaker_failure(breaker, error, config)
+        else:
+            # Сайт ответил (например, 404) - хост доступен, повторять запрос бессмысленно
+            _breaker_success(breaker, config)
+        logger.warning(config['logger_messages']['fetch_attempt_failed'].format(url=url, attempt=attempt + 1, attempts=attempts, e=error))
+
+        if not retryable or attempt == attempts - 1:
+            break
+        await asyncio.sleep(random.uniform(0, min(settings['backoff_max'], settings['backoff_base'] * 2 ** attempt)))
+
+    return None
+
 async def get_schedule_link(session: aiohttp.ClientSession, config: dict) -> Optional[str]:
     try:
-        async with session.get(config['url_parser']['schedule_page_url'], ssl=False) as response:
-            content = await response.read()
-            soup = BeautifulSoup(content, 'html.parser')
+        content = await fetch(session, config['url_parser']['schedule_page_url'], config)
+        if content is None:
+            return None
+        soup = BeautifulSoup(content, 'html.parser')
 
-            # Ищем ссылку с текстом, указанным в конфиге
-            link = soup.find('a', string=config['url_parser']['schedule_link_text'])
+        # Ищем ссылку с текстом, указанным в конфиге
+        link = soup.find('a', string=config['url_parser']['schedule_link_text'])
 
-            if link and link.has_attr('href'):
-                full_url = config['url_parser']['base_url'] + link['href']
-                logger.info(config['logger_messages']['parser_link_founded'].format(full_url=full_url))
-                return full_url
+        if link and link.has_attr('href'):
+            full_url = config['url_parser']['base_url'] + link['href']
+            logger.info(config['logger_messages']['parser_link_founded'].format(full_url=full_url))
+            return full_url
 
-            logger.warning(config['logger_messages']['parser_link_not_founded'])
-            return None
+        logger.warning(config['logger_messages']['parser_link_not_founded'])
+        return None
     except Exception as e:
         logger.error(config['logger_messages']['parser_error'].format(e=e))
         return None
 
-async def download_schedule(file_path, config: dict) -> Optional[str]:
+async def install_schedule(file_path, content: bytes, config: dict, source: str, history_dir: Optional[str] = None) -> Optional[dict]:
+    """
+    Проверяет новый файл расписания и, если он разбирается, атомарно заменяет им текущий.
+
+    Args:
+        file_path: Путь к файлу с расписанием
+        content (bytes): Содержимое нового xlsx-файла
+        config (dict): Конфигурация
+        source (str): Откуда файл: "download" - сайт, "upload" - прислал администратор
+        history_dir (Optional[str]): Директория истории версий (None - не сохранять версию)
+
+    Returns:
+        Optional[dict]: Разобранное расписание или None, если файл не прошёл проверку или это скачанная
+        версия, от которой откатились (текущий файл не изменяется)
+    """
+    # Версию, от которой откатились, не разбираем зря (окончательно проверяется перед заменой файла)
+    if not await asyncio.to_thread(_download_allowed, content, source, history_dir, config):
+        return None
+
+    # Проверяем, что файл - разбираемое расписание; иначе остаётся последняя проверенная версия
     try:
-        async with aiohttp.ClientSession() as session:
-            # Получаем URL для скачивания
-            schedule_url = await get_schedule_link(session, config)
-            if not schedule_url:
-                logger.error(config['logger_messages']['parser_failed'])
-                return None
-
-            # Скачиваем файл
-            async with session.get(schedule_url, ssl=False) as response:
-                if response.status == 200:
-                    content = await response.read()
+        schedule = await asyncio.to_thread(read_schedule_file, content, config)
+    except Exception as e:
+        logger.error(config['logger_messages']['file_invalid'].format(e=e))
+        return None
+    if not schedule['days']:
+        logger.error(config['logger_messages']['file_invalid'].format(e="no days found"))
+        return None
+
+    if not await asyncio.to_thread(_replace_schedule, file_path, content, schedule, source, history_dir, config):
+        return None
+    return schedule
+
+def _download_allowed(content: bytes, source: str, history_dir: Optional[str], config: dict) -> bool:
+    if source != "download" or history_dir is None:
+        return True
+    file_hash = hashlib.sha256(content).hexdigest()
+    if check_download(history_dir, file_hash):
+        return True
+    logger.warning(config['logger_messages']['download_blocked'].format(file_hash=file_hash[:12]))
+    return False
 
-                    # Сохраняем в указанный файл (перезаписываем существующий)
-                    with open(file_path, 'wb') as file:
-                        file.write(content)
+def _replace_schedule(file_path, content: bytes, schedule: dict, source: str, history_dir: Optional[str], config: dict) -> bool:
+    # Под той же блокировкой, что и откат: файл расписания и текущая версия в истории меняются вместе
+    with install_lock:
+        if not _download_allowed(content, source, history_dir, config):
+            return False
+        # Заменяем файл атомарно: читатели видят либо старую, либо новую версию целиком
+        write_atomic(file_path, content)
+        store_schedule(str(file_path), schedule, config)
+        if history_dir is not None:
+            record_version(history_dir, content, schedule, source, config)
+        return True
 
-                    logger.info(config['logger_messages']['file_downloaded'].format(file_path=file_path))
-                    return str(file_path)
-                else:
-                    logger.error(config['logger_messages']['file_download_failed'].format(rs=response.status))
-                    return None
+async def _download_schedule(file_path, config: dict, history_dir: Optional[str]) -> Optional[str]:
+    async with aiohttp.ClientSession() as session:
+        # Получаем URL для скачивания
+        schedule_url = await get_schedule_link(session, config)
+        if not schedule_url:
+            logger.error(config['logger_messages']['parser_failed'])
+            return None
+
+        # Скачиваем файл
+        content = await fetch(session, schedule_url, config)
+        if content is None:
+            logger.error(config['logger_messages']['file_download_failed'].format(url=schedule_url))
+            return None
+
+    if await install_schedule(file_path, content, config, "download", history_dir) is None:
+        return None
+
+    logger.info(config['logger_messages']['file_downloaded'].format(file_path=file_path))
+    return str(file_path)
+
+async def download_schedule(file_path, config: dict, deadline: Optional[float] = None, history_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Скачивает расписание с сайта и заменяет им файл, если оно прошло проверку.
+
+    Args:
+        file_path: Путь к файлу с расписанием
+        config (dict): Конфигурация
+        deadline (Optional[float]): Ограничение на всю загрузку в секундах (None - без ограничения)
+        history_dir (Optional[str]): Директория истории версий (None - не сохранять версию)
+
+    Returns:
+        Optional[str]: Путь к обновлённому файлу или None, если обновить не удалось (файл не изменяется)
+    """
+    try:
+        return await asyncio.wait_for(_download_schedule(file_path, config, history_dir), deadline)
+    except asyncio.TimeoutError:
+        logger.error(config['logger_messages']['file_download_deadline'].format(deadline=deadline))
+        return None
     except Exception as e:
         logger.error(config['logger_messages']['file_download_error'].format(e=e))
         return None
@@ -5,13 +5,29 @@ from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Кэши файлов доступа, сбрасываются при изменении файла (mtime/размер)
+_ids_cache = {}  # {file_path: (stat, set(ID))}
+_offsets_cache = {}  # {file_path: (stat, [смещения непустых строк])}
+
+def _file_stat(file_path: str) -> tuple:
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def load_ids(file_path: str) -> set:
+    """Множество ID из файла доступа (файл перечитывается только после изменения)"""
+    stat = _file_stat(file_path)
+    cached = _ids_cache.get(file_path)
+    if cached is None or cached[0] != stat:
+        with open(file_path, 'r') as f:
+            cached = (stat, {line.strip() for line in f if line.strip()})
+        _ids_cache[file_path] = cached
+    return cached[1]
+
 async def is_banned(blacklist_file: str, user_id: int, config: dict) -> bool:
     if not os.path.exists(blacklist_file):
         logger.warning(config['logger_messages']['blacklist_file_not_found'])
         return False
-    with open(blacklist_file, 'r') as f:
-        permitted_users = [line.strip() for line in f.readlines()]
-    return str(user_id) in permitted_users
+    return str(user_id) in load_ids(blacklist_file)
 
 async def is_in_chat(bot: Bot, group_id: int, user_id: int, config: dict) -> bool:
     try:
@@ -25,9 +41,7 @@ async def has_permission(permissions_file: str, user_id: int, config: dict) -> b
     if not os.path.exists(permissions_file):
         logger.warning(config['logger_messages']['permissions_file_not_found'].format(permissions_file=permissions_file))
         return False
-    with open(permissions_file, 'r') as f:
-        permitted_users = [line.strip() for line in f.readlines()]
-    return str(user_id) in permitted_users
+    return str(user_id) in load_ids(permissions_file)
 
 async def check_user_permission(bot: Bot, need_admin_rights: bool, group_id: int, permissions_file: str, blacklist_file: str, user_id: int, config: dict) -> bool:
     if await is_banned(blacklist_file, user_id, config):
@@ -35,10 +49,11 @@ async def check_user_permission(bot: Bot, need_admin_rights: bool, group_id: int
     else:
         if need_admin_rights is True:
             return await has_permission(permissions_file, user_id, config)
-        else: 
-            if await is_in_chat(bot, group_id, user_id, config):
+        else:
+            # Сначала локальный файл доступов: он не требует запроса к Bot API
+            if await has_permission(permissions_file, user_id, config):
                 return True
-            return await has_permission(permissions_file, user_id, config)
+            return await is_in_chat(bot, group_id, user_id, config)
 
 async def manage_user_id(file_path: str, user_id: int, action: str, config: dict) -> str:
     """
@@ -92,3 +107,105 @@ async def manage_user_id(file_path: str, user_id: int, action: str, config: dict
     except Exception as e:
         logger.error(config['logger_messages']['manage_user_id_error'].format(user_id=user_id, file_path=file_path, e=e))
         return "error"
+
+def is_valid_id(value: str) -> bool:
+    """ID пользователя Telegram: от 9 до 11 цифр"""
+    return value.isdigit() and 9 <= len(value) <= 11
+
+def parse_ids(content: str) -> tuple:
+    """
+    Извлекает ID из содержимого .txt/.csv файла: по одному в строке или через запятую/точку с запятой.
+
+    Returns:
+        tuple: (список корректных ID без повторов, количество некорректных значений)
+    """
+    ids = {}
+    invalid = 0
+    for value in re.split(r'[\s,;]+', content):
+        value = value.strip().strip('"\'')
+        if not value:
+            continue
+        if is_valid_id(value):
+            ids[value] = None
+        else:
+            invalid += 1
+    return list(ids), invalid
+
+async def manage_user_ids(file_path: str, user_ids: list, action: str, config: dict) -> Optional[dict]:
+    """
+    Добавляет или удаляет несколько ID одной операцией: файл переписывается атомарно
+    (через временный файл), поэтому при ошибке остаётся прежняя версия списка.
+
+    Args:
+        file_path: Путь к файлу доступа
+        user_ids: ID пользователей (строки)
+        action: "add" для добавления, "remove" для удаления
+
+    Returns:
+        {"changed": изменено ID, "skipped": пропущено (уже есть / не найдено)} или None при ошибке
+    """
+    try:
+        lines = []
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                lines = [line.strip() for line in f if line.strip()]
+        existing = set(lines)
+
+        if action == "add":
+            new_ids = [user_id for user_id in user_ids if user_id not in existing]
+            lines.extend(new_ids)
+            changed = len(new_ids)
+        else:
+            to_remove = existing.intersection(user_ids)
+            lines = [line for line in lines if line not in to_remove]
+            changed = len(to_remove)
+
+        if changed:
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.writelines(f"{line}\n" for line in lines)
+            os.replace(tmp_path, file_path)
+
+        return {"changed": changed, "skipped": len(user_ids) - changed}
+
+    except Exception as e:
+        logger.error(config['logger_messages']['manage_user_ids_error'].format(count=len(user_ids), file_path=file_path, e=e))
+        return None
+
+def _line_offsets(file_path: str) -> list:
+    """Смещения начала непустых строк файла; пересчитываются только после изменения файла"""
+    stat = _file_stat(file_path)
+    cached = _offsets_cache.get(file_path)
+    if cached is None or cached[0] != stat:
+        offsets = []
+        position = 0
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+        cached = (stat, offsets)
+        _offsets_cache[file_path] = cached
+    return cached[1]
+
+def read_ids_page(file_path: str, page: int, page_size: int) -> tuple:
+    """
+    Читает одну страницу ID из файла доступа, не загружая остальной файл.
+
+    Returns:
+        tuple: (ID на странице, всего ID в файле)
+    """
+    offsets = _line_offsets(file_path)
+    page_offsets = offsets[page * page_size:(page + 1) * page_size]
+
+    ids = []
+    if page_offsets:
+        with open(file_path, 'rb') as f:
+            f.seek(page_offsets[0])
+            while len(ids) < len(page_offsets):
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    ids.append(line.strip().decode('utf-8', errors='replace'))
+    return ids, len(offsets)
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from modules.schedule_parser import read_schedule_file, schedule_version, store_schedule
+
+logger = logging.getLogger(__name__)
+
+# История хранится по содержимому: <history_dir>/<хэш файла>.xlsx и разобранные формы
+# <хэш файла>.<версия>.json (версия зависит и от настроек парсинга). Порядок версий - в index.json
+INDEX_FILE = "index.json"
+
+# Замена файла расписания (загрузка, откат) и изменения index.json выполняются в разных потоках.
+# Всё это - под одной блокировкой, иначе текущая версия в истории может разойтись с файлом расписания
+install_lock = threading.RLock()
+
+def write_atomic(path: Path, data: bytes):
+    """Записывает файл через временный (с уникальным именем) и атомарно заменяет им исходный"""
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _load_index(history_dir: Path) -> dict:
+    try:
+        with open(history_dir / INDEX_FILE, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = {'current': None, 'versions': []}
+    # blocked - версии с сайта, заменённые вручную (откатом или загрузкой файла);
+    # blocked_seen_at - когда сайт последний раз отдал одну из них; site_hash - последний скачанный с сайта файл;
+    # block_next_download - файл загружен до первой загрузки с сайта, и что там сейчас, неизвестно
+    index.setdefault('blocked', [])
+    index.setdefault('blocked_seen_at', None)
+    index.setdefault('site_hash', None)
+    index.setdefault('block_next_download', False)
+    return index
+
+def _save_index(history_dir: Path, index: dict):
+    write_atomic(history_dir / INDEX_FILE, json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+
+def list_versions(history_dir: str) -> tuple:
+    """
+    Returns:
+        tuple: (хэш текущей версии, [{'file_hash', 'saved_at', 'source', 'first_day', 'last_day', 'days'}] от новых к старым)
+    """
+    index = _load_index(Path(history_dir))
+    return index['current'], index['versions']
+
+def check_download(history_dir: str, file_hash: str) -> bool:
+    """
+    Можно ли установить скачанную с сайта версию. Версия с сайта, которую администратор заменил
+    (откатом или загрузкой своего файла), не устанавливается, пока на сайте не появится другой файл -
+    иначе прогрев перед рассылкой сразу отменил бы ручную замену.
+    """
+    with install_lock:
+        history_dir = Path(history_dir)
+        index = _load_index(history_dir)
+        index['site_hash'] = file_hash
+        if index['block_next_download']:
+            index['block_next_download'] = False
+            if file_hash != index['current'] and file_hash not in index['blocked']:
+                index['blocked'].append(file_hash)
+        if file_hash not in index['blocked']:
+            if history_dir.exists():
+                _save_index(history_dir, index)
+            return True
+        index['blocked_seen_at'] = time.time()
+        _save_index(history_dir, index)
+        return False
+
+def download_blocked_since(history_dir: str, since: float) -> bool:
+    """Отдавал ли сайт заменённую вручную версию, начиная с момента since (time.time())"""
+    seen_at = _load_index(Path(history_dir))['blocked_seen_at']
+    return seen_at is not None and seen_at >= since
+
+def record_version(history_dir: str, content: bytes, schedule: dict, source: str, config: dict) -> Optional[dict]:
+    """
+    Сохраняет версию расписания вместе с разобранной формой и делает её текущей.
+    Хранится не больше history.max_versions версий, самые старые удаляются.
+
+    Args:
+        history_dir (str): Директория истории
+        content (bytes): Содержимое xlsx-файла
+        schedule (dict): Разобранное расписание (см. schedule_parser.read_schedule_file)
+        source (str): Откуда версия: "download", "upload", "initial"
+        config (dict): Конфигурация
+
+    Returns:
+        Optional[dict]: Запись о версии или None в случае ошибки
+    """
+    try:
+        with install_lock:
+            history_dir = Path(history_dir)
+            history_dir.mkdir(parents=True, exist_ok=True)
+            file_hash = schedule['file_hash']
+
+            blob_path = history_dir / f"{file_hash}.xlsx"
+            if not blob_path.exists():
+                write_atomic(blob_path, content)
+            parsed_path = history_dir / f"{file_hash}.{schedule['version']}.json"
+            if not parsed_path.exists():
+                write_atomic(parsed_path, json.dumps(schedule, ensure_ascii=False).encode('utf-8'))
+
+            index = _load_index(history_dir)
+            entry = next((entry for entry in index['versions'] if entry['file_hash'] == file_hash), None)
+            if entry is None:
+                days = schedule['days']
+                entry = {
+                    'file_hash': file_hash,
+                    'saved_at': datetime.now().strftime('%d.%m.%Y %H:%M'),
+                    'source': source,
+                    'first_day': days[0]['date_str'] if days else None,
+                    'last_day': days[-1]['date_str'] if days else None,
+                    'days': len(days),
+                }
+                index['versions'].insert(0, entry)
+                logger.info(config['logger_messages']['history_recorded'].format(file_hash=file_hash[:12], source=source))
+            index['current'] = file_hash
+            if source == "download":
+                # На сайте появился другой файл - отложенные версии он больше не отдаёт
+                index['blocked'] = []
+            elif source == "upload":
+                if file_hash in index['blocked']:
+                    # Администратор сам загрузил отложенную версию
+                    index['blocked'].remove(file_hash)
+                # Загруженный файл заменяет версию с сайта: она откладывается так же, как при откате
+                if index['site_hash'] is None:
+                    index['block_next_download'] = True
+                elif index['site_hash'] != file_hash and index['site_hash'] not in index['blocked']:
+                    index['blocked'].append(index['site_hash'])
+
+            # Удаляем старые версии (текущую - никогда)
+            max_versions = config['history']['max_versions']
+            kept = index['versions'][:max_versions]
+            for old in index['versions'][max_versions:]:
+                if old['file_hash'] == index['current']:
+                    kept.append(old)
+                    continue
+                for path in history_dir.glob(f"{old['file_hash']}.*"):
+                    path.unlink()
+            index['versions'] = kept
+
+            _save_index(history_dir, index)
+            return entry
+
+    except Exception as e:
+        logger.error(config['logger_messages']['history_error'].format(e=e))
+        return None
+
+def record_current(history_dir: str, schedule_file: str, schedule: Optional[dict], config: dict):
+    """Добавляет в историю текущий файл расписания, если его там нет (например, при первом запуске)"""
+    if schedule is None:
+        return
+    with install_lock:
+        current, versions = list_versions(history_dir)
+        if current == schedule['file_hash'] and any(entry['file_hash'] == current for entry in versions):
+            return
+        with open(schedule_file, 'rb') as f:
+            content = f.read()
+        if hashlib.sha256(content).hexdigest() == schedule['file_hash']:
+            record_version(history_dir, content, schedule, "initial", config)
+
+def rollback(history_dir: str, schedule_file: str, file_hash: str, config: dict) -> Optional[dict]:
+    """
+    Делает версию из истории текущей: файл расписания заменяется сохранённым, а разобранная форма
+    сразу кладётся в кэш парсера - без повторной загрузки и разбора книги.
+    Версия, от которой откатились, не будет установлена с сайта, пока там не появится другой файл.
+
+    Args:
+        history_dir (str): Директория истории
+        schedule_file (str): Путь к файлу с расписанием
+        file_hash (str): Хэш версии (можно начало хэша)
+        config (dict): Конфигурация
+
+    Returns:
+        Optional[dict]: Запись о версии или None, если версия не найдена или произошла ошибка
+    """
+    try:
+        with install_lock:
+            history_dir = Path(history_dir)
+            index = _load_index(history_dir)
+            entry = next((entry for entry in index['versions'] if entry['file_hash'].startswith(file_hash)), None)
+            if entry is None:
+                return None
+
+            with open(history_dir / f"{entry['file_hash']}.xlsx", 'rb') as f:
+                content = f.read()
+
+            parsed_path = history_dir / f"{entry['file_hash']}.{schedule_version(entry['file_hash'], config)}.json"
+            if parsed_path.exists():
+                with open(parsed_path, 'r', encoding='utf-8') as f:
+                    schedule = json.load(f)
+            else:
+                # Настройки парсинга изменились после сохранения версии - разбираем заново и сохраняем новую форму
+                schedule = read_schedule_file(content, config)
+                write_atomic(parsed_path, json.dumps(schedule, ensure_ascii=False).encode('utf-8'))
+
+            write_atomic(Path(schedule_file), content)
+            store_schedule(schedule_file, schedule, config)
+
+            # Версия, от которой откатились, откладывается; к отложенной версии администратор может вернуться сам
+            if index['current'] is not None and index['current'] != entry['file_hash'] and index['current'] not in index['blocked']:
+                index['blocked'].append(index['current'])
+            if entry['file_hash'] in index['blocked']:
+                index['blocked'].remove(entry['file_hash'])
+            index['current'] = entry['file_hash']
+            _save_index(history_dir, index)
+            return entry
+
+    except Exception as e:
+        logger.error(config['logger_messages']['history_error'].format(e=e))
+        return None
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from modules.schedule_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Индекс занятости для текущей версии расписания
+_occupancy_cache = {'version': None, 'index': None}
+
+def _day_fingerprint(day: dict) -> str:
+    return hashlib.sha256(json.dumps(day, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _is_ignored_room(room: str, config: dict) -> bool:
+    return room.strip().upper() in {name.upper() for name in config['occupancy']['ignore_rooms']}
+
+def build_day_occupancy(day: dict, config: dict) -> dict:
+    """
+    Строит занятость кабинетов и преподавателей по временным блокам одного дня.
+
+    Returns:
+        dict: {'fingerprint', 'date_str', 'slots': [{'time', 'rooms': {кабинет: группа},
+              'teachers': {преподаватель: {'group', 'subject', 'rooms'}}}]}
+    """
+    slots = [{'time': time_value, 'rooms': {}, 'teachers': {}} for time_value in day['slots']]
+
+    for group, entries in day['groups'].items():
+        for entry in entries:
+            busy = slots[entry['slot']]
+            rooms = [room for room in entry['rooms'] if not _is_ignored_room(room, config)]
+            for room in rooms:
+                busy['rooms'][room] = group
+            for teacher in entry['teachers']:
+                busy['teachers'][teacher] = {
+                    'group': group,
+                    'subject': ", ".join(entry['subjects']),
+                    'rooms': rooms,
+                }
+
+    return {'fingerprint': _day_fingerprint(day), 'date_str': day['date_str'], 'slots': slots}
+
+def build_occupancy_index(schedule: dict, config: dict, previous: Optional[dict] = None) -> dict:
+    """
+    Строит индекс занятости: дата x временной блок -> занятые кабинеты и преподаватели.
+
+    Если передан предыдущий индекс, дни с неизменившимся содержимым переиспользуются,
+    а перестраиваются только изменившиеся.
+
+    Args:
+        schedule (dict): Разобранное расписание (см. schedule_parser.read_schedule_file)
+        config (dict): Конфигурация
+        previous (Optional[dict]): Индекс предыдущей версии расписания
+
+    Returns:
+        dict: {'version', 'days': {(день, месяц): занятость дня}, 'rooms': [все кабинеты], 'teachers': {имя: токены}}
+    """
+    reusable = {day['fingerprint']: day for day in previous['days'].values()} if previous else {}
+
+    days = {}
+    rebuilt = 0
+    for day in schedule['days']:
+        key = (day['day'], day['month'])
+        if key in days:
+            continue  # Как и find_day, берём первое вхождение даты
+
+        occupancy = reusable.get(_day_fingerprint(day))
+        if occupancy is None:
+            occupancy = build_day_occupancy(day, config)
+            rebuilt += 1
+        days[key] = occupancy
+
+    rooms = set(config['occupancy']['extra_rooms'])
+    teachers = {}
+    for occupancy in days.values():
+        for slot in occupancy['slots']:
+            rooms.update(slot['rooms'])
+            for teacher in slot['teachers']:
+                teachers.setdefault(teacher, tokenize(teacher))
+
+    logger.info(config['logger_messages']['occupancy_rebuilt'].format(changed=rebuilt, total=len(days)))
+    return {
+        'version': schedule['version'],
+        'days': days,
+        'rooms': sorted(rooms, key=lambda room: (len(room), room)),
+        'teachers': teachers,
+    }
+
+def get_occupancy_index(schedule: dict, config: dict) -> dict:
+    """Возвращает индекс занятости для версии расписания, при смене версии перестраивая только изменившиеся дни"""
+    if _occupancy_cache['version'] != schedule['version']:
+        _occupancy_cache['index'] = build_occupancy_index(schedule, config, previous=_occupancy_cache['index'])
+        _occupancy_cache['version'] = schedule['version']
+    return _occupancy_cache['index']
+
+def invalidate_occupancy_index():
+    """Сбрасывает индекс (при изменении настроек occupancy), следующий запрос построит его заново"""
+    _occupancy_cache.update(version=None, index=None)
+
+def find_free_rooms(index: dict, target_date: datetime, slot: Optional[int] = None) -> Optional[list]:
+    """
+    Свободные кабинеты по временным блокам дня.
+
+    Args:
+        index (dict): Индекс занятости
+        target_date (datetime): День
+        slot (Optional[int]): Номер временного блока (с нуля); если не указан - все блоки дня
+
+    Returns:
+        Optional[list]: [(номер блока, время, [свободные кабинеты])] или None, если дня нет в расписании
+    """
+    day = index['days'].get((target_date.day, target_date.month))
+    if day is None:
+        return None
+
+    slots = range(len(day['slots'])) if slot is None else [slot] if 0 <= slot < len(day['slots']) else []
+    return [
+        (number, day['slots'][number]['time'], [room for room in index['rooms'] if room not in day['slots'][number]['rooms']])
+        for number in slots
+    ]
+
+def find_teachers(index: dict, query: str) -> list:
+    """Преподаватели, у которых каждое слово запроса совпадает с началом слова имени"""
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return []
+    return sorted(
+        teacher for teacher, tokens in index['teachers'].items()
+        if all(any(token.startswith(query_token) for token in tokens) for query_token in query_tokens)
+    )
+
+def teacher_availability(index: dict, teacher: str, target_date: datetime) -> Optional[list]:
+    """
+    Занятость преподавателя по временным блокам дня.
+
+    Returns:
+        Optional[list]: [(номер блока, время, занятие или None)] или None, если дня нет в расписании
+    """
+    day = index['days'].get((target_date.day, target_date.month))
+    if day is None:
+        return None
+    return [(number, slot['time'], slot['teachers'].get(teacher)) for number, slot in enumerate(day['slots'])]
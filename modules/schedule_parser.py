@@ -1,8 +1,15 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from io import BytesIO
 from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string
 from datetime import datetime, timedelta
 from typing import Optional
 import logging
-from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
@@ -12,103 +19,253 @@ months = {
     9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
 }
 
-async def parse_schedule_for_date(schedule_file: str, config: dict, target_date: datetime) -> Optional[str]:
+# Номер месяца по названию в родительном падеже: 'СЕНТЯБРЯ' -> 9
+month_numbers = {name.upper(): number for number, name in months.items()}
+
+# Дата в заголовке дня: "ВТОРНИК, 02 СЕНТЯБРЯ 2025 г."
+DATE_PATTERN = re.compile(r'(\d{1,2})\s+(' + '|'.join(month_numbers) + r')(?:\s+(\d{4}))?')
+# Преподаватель в ячейке занятия: "Гягяева А.Г.", "Бережков А.В"
+TEACHER_PATTERN = re.compile(r'^[А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?\s+[А-ЯЁ]\.\s?[А-ЯЁ]\.?$')
+
+# Разобранное расписание кэшируется: файл перечитывается только при изменении, а разбирается только при смене версии
+_schedule_cache = {'stat': None, 'settings': None, 'schedule': None}
+_schedule_lock = threading.Lock()
+
+def _parser_settings(config: dict) -> str:
+    """Настройки парсинга, влияющие на разбор всего листа (group_name не влияет - разбираются все группы)"""
+    settings = {key: value for key, value in config['schedule_parser'].items() if key not in ('group_name', 'group_column')}
+    return json.dumps(settings, sort_keys=True, ensure_ascii=False)
+
+def schedule_version(file_hash: str, config: dict) -> str:
+    """Версия расписания: содержимое файла плюс настройки парсинга"""
+    return hashlib.sha256((file_hash + _parser_settings(config)).encode('utf-8')).hexdigest()[:16]
+
+def read_schedule_file(content: bytes, config: dict) -> dict:
     """
-    Парсит расписание для указанной даты из Excel-файла.
-    
+    Разбирает весь лист расписания: все дни и все группы.
+
+    Args:
+        content (bytes): Содержимое xlsx-файла
+        config (dict): Конфигурация с настройками парсинга
+
+    Returns:
+        dict: {'file_hash', 'version', 'days': [{'title', 'day', 'month', 'year', 'date_str', 'slots',
+              'groups': {группа: [{'slot', 'time', 'lines', 'rooms', 'subjects', 'teachers'}]}}]}
+    """
+    settings = config['schedule_parser']
+    wb = load_workbook(BytesIO(content), read_only=True)
+    ws = wb[settings['target_sheet']]
+    rows = [list(row) for row in ws.iter_rows(values_only=True)]
+    wb.close()
+
+    def value(row: int, col: int):
+        if 1 <= row <= len(rows) and 1 <= col <= len(rows[row - 1]):
+            return rows[row - 1][col - 1]
+        return None
+
+    date_col = column_index_from_string(settings['date_column'])
+    time_col = column_index_from_string(settings['time_column'])
+    max_col = max((len(row) for row in rows), default=0)
+
+    days = []
+    for date_row in range(1, len(rows) + 1):
+        title = value(date_row, date_col)
+        if not title or not isinstance(title, str) or "ГАПОУ" in title.upper():
+            continue
+        match = DATE_PATTERN.search(title.upper())
+        if not match:
+            continue
+
+        # По будням под группой 16 строк, в субботу 10
+        if "СУББОТА" in title.upper():
+            rows_to_fetch = settings['rtf_saturday']
+        else:
+            rows_to_fetch = settings['rows_to_fetch']
+
+        # Строка с группами - через 4 строки после даты
+        groups_row = date_row + 4
+
+        # Временные блоки: строка со временем открывает блок, пока время не сменится
+        blocks = []
+        current_time = None
+        for row_index in range(groups_row + 1, groups_row + rows_to_fetch + 1):
+            time_value = value(row_index, time_col)
+            if time_value and time_value != current_time:
+                current_time = time_value
+                blocks.append((str(time_value), []))
+            elif not blocks:
+                blocks.append((None, []))
+            blocks[-1][1].append(row_index)
+
+        groups = {}
+        for col in range(1, max_col + 1):
+            group_name = value(groups_row, col)
+            if not group_name or col in (date_col, time_col):
+                continue
+
+            # Справа от колонки группы - колонка "№ кабинета"
+            room_header = value(groups_row - 1, col + 1)
+            room_col = col + 1 if room_header and "КАБИНЕТ" in str(room_header).upper() else None
+
+            entries = []
+            for slot, (time_value, block_rows) in enumerate(blocks):
+                lines = [str(value(row, col)) for row in block_rows if value(row, col)]
+                rooms = [str(value(row, room_col)) for row in block_rows if room_col and value(row, room_col)]
+                entries.append({
+                    'slot': slot,
+                    'time': time_value,
+                    'lines': lines,
+                    'rooms': rooms,
+                    'subjects': [line for line in lines if not TEACHER_PATTERN.match(line.strip())],
+                    'teachers': [line.strip() for line in lines if TEACHER_PATTERN.match(line.strip())],
+                })
+            groups[str(group_name).strip()] = entries
+
+        day, month, year = int(match.group(1)), month_numbers[match.group(2)], match.group(3)
+        days.append({
+            'title': title.strip(),
+            'day': day,
+            'month': month,
+            'year': int(year) if year else None,
+            'date_str': f"{day} {months[month]}",
+            'slots': [time_value for time_value, _ in blocks],
+            'groups': groups,
+        })
+
+    file_hash = hashlib.sha256(content).hexdigest()
+    return {
+        'file_hash': file_hash,
+        'version': schedule_version(file_hash, config),
+        'days': days,
+    }
+
+def _file_stat(schedule_file: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(schedule_file)
+    except FileNotFoundError:
+        return None
+    return (schedule_file, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def load_schedule(schedule_file: str, config: dict) -> Optional[dict]:
+    """
+    Возвращает разобранное расписание (см. read_schedule_file), разбирая файл только при смене его версии.
+
     Args:
         schedule_file (str): Путь к файлу с расписанием
         config (dict): Конфигурация с настройками парсинга
-        target_date (datetime): День, на который нужно получить расписание
-        
+
     Returns:
-        Optional[str]: Отформатированное расписание или None в случае ошибки
+        Optional[dict]: Разобранное расписание или None в случае ошибки
     """
     try:
-        # Проверяем существование файла
-        if not Path(schedule_file).exists():
+        stat = _file_stat(schedule_file)
+        if stat is None:
             logger.error(config['logger_messages']['schedule_file_not_found'])
             return None
+        settings = _parser_settings(config)
 
-        # Загружаем книгу и выбираем нужный лист
-        wb = load_workbook(schedule_file)
-        ws = wb[config['schedule_parser']['target_sheet']]
-
-        # Форматируем строку для поиска даты
-        date_str = f"{target_date.day} {months[target_date.month]}".upper()
-        
-        date_col = config['schedule_parser']['date_column']
-        time_col = config['schedule_parser']['time_column']
-        group_name = config['schedule_parser']['group_name']
-        rows_to_fetch = config['schedule_parser']['rows_to_fetch']
-
-        # Ищем строку с нужной датой
-        date_row = None
-        for row in range(1, ws.max_row + 1):
-            cell_value = ws[f'{date_col}{row}'].value
-            if cell_value and isinstance(cell_value, str) and date_str in cell_value.upper() and "ГАПОУ" not in cell_value.upper():
-                date_row = row
-                
-                # Проверяем, является ли день субботой
-                date_cell_value = ws[f'{date_col}{date_row}'].value
-                if date_cell_value and isinstance(date_cell_value, str) and "СУББОТА" in date_cell_value.upper():
-                    rows_to_fetch = config['schedule_parser']['rtf_saturday']  # Значение для субботы
-                else:
-                    rows_to_fetch = config['schedule_parser']['rows_to_fetch']  # Стандартное значение
-                
-                break
-
-        if not date_row:
-            return None
-          
-        # Находим строку с группами (обычно через 4 строки после даты)
-        groups_row = date_row + 4
+        with _schedule_lock:
+            if _schedule_cache['stat'] == stat and _schedule_cache['settings'] == settings:
+                return _schedule_cache['schedule']
 
-        # Динамически ищем колонку с нужной группой
-        group_column = None
-        for col in range(1, ws.max_column + 1):
-            cell_value = ws.cell(row=groups_row, column=col).value
-            if cell_value and group_name in str(cell_value):
-                group_column = col
-                break
+            with open(schedule_file, 'rb') as f:
+                content = f.read()
 
-        if not group_column:
-            return None
+            # Файл мог быть перезаписан тем же содержимым - тогда повторный разбор не нужен
+            schedule = _schedule_cache['schedule']
+            if schedule is None or _schedule_cache['settings'] != settings or \
+                    schedule['file_hash'] != hashlib.sha256(content).hexdigest():
+                schedule = read_schedule_file(content, config)
 
-        # Собираем данные о расписании
-        schedule_lines = []
-        current_time = None
+            _schedule_cache.update(stat=stat, settings=settings, schedule=schedule)
+            return schedule
 
-        # Проходим по 16 строкам с расписанием "под группой" по будням, 10 в субботу
-        for i in range(1, rows_to_fetch + 1):
-            row_index = groups_row + i
-            
-            # Проверяем ячейку времени
-            time_value = ws[f'{time_col}{row_index}'].value
-            
-            # Если нашли новое время, добавляем его в расписание
-            if time_value and time_value != current_time:
-                if current_time is not None:
-                    schedule_lines.append("")  # Пустая строка между временными блоками
-                current_time = time_value
-                schedule_lines.append(current_time)
-            
-            # Добавляем данные из колонки группы (если есть)
-            group_value = ws.cell(row=row_index, column=group_column).value
-            if group_value:
-                schedule_lines.append(str(group_value))
-
-        # Форматируем и возвращаем результат
-        if schedule_lines:
-            schedule_text = "\n".join(schedule_lines)
-            return f"{schedule_text}" # Расписание на {date_str.lower()}:\n
-        'else:' # Думаю, что эта проверка лишняя
-        #    return f"На {date_str.lower()} занятий нет"
-    
     except Exception as e:
         logger.error(config['logger_messages']['schedule_parser_error'].format(e=e))
         return None
 
+def store_schedule(schedule_file: str, schedule: dict, config: dict):
+    """Кладёт в кэш уже разобранное расписание только что записанного файла, чтобы не разбирать его повторно"""
+    with _schedule_lock:
+        _schedule_cache.update(stat=_file_stat(schedule_file), settings=_parser_settings(config), schedule=schedule)
+
+async def get_schedule(schedule_file: str, config: dict) -> Optional[dict]:
+    """Асинхронная обёртка над load_schedule: разбор книги (блокирующий) выполняется в отдельном потоке"""
+    if _schedule_cache['stat'] is not None and _schedule_cache['stat'] == _file_stat(schedule_file) \
+            and _schedule_cache['settings'] == _parser_settings(config):
+        return _schedule_cache['schedule']
+    return await asyncio.to_thread(load_schedule, schedule_file, config)
+
+def find_day(schedule: dict, target_date: datetime) -> Optional[dict]:
+    """Ищет день расписания по числу и месяцу"""
+    for day in schedule['days']:
+        if day['day'] == target_date.day and day['month'] == target_date.month:
+            return day
+    return None
+
+def format_day_for_group(day: dict, group_name: str) -> Optional[str]:
+    """Форматирует расписание группы на день: время блока и занятия под ним, блоки разделены пустой строкой"""
+    entries = next((entries for name, entries in day['groups'].items() if group_name in name), None)
+    if entries is None:
+        return None
+
+    schedule_lines = []
+    for entry in entries:
+        if entry['time'] is not None:
+            if schedule_lines:
+                schedule_lines.append("")  # Пустая строка между временными блоками
+            schedule_lines.append(entry['time'])
+        schedule_lines.extend(entry['lines'])
+
+    if schedule_lines:
+        return "\n".join(schedule_lines)
+    return None
+
+def parse_date_argument(value: str, config: dict) -> Optional[datetime]:
+    """Разбирает дату из аргумента команды: 'сегодня', 'завтра', 'ДД.ММ' или 'ДД.ММ.ГГГГ'"""
+    value = value.strip().lower()
+    today = datetime.now()
+    if value in ("сегодня", config['buttons_text']['reply']['today'].lower()):
+        return today
+    if value in ("завтра", config['buttons_text']['reply']['tomorrow'].lower()):
+        return today + timedelta(days=1)
+
+    match = re.fullmatch(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{2}|\d{4}))?', value)
+    if not match:
+        return None
+    year = int(match.group(3)) if match.group(3) else today.year
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, int(match.group(2)), int(match.group(1)))
+    except ValueError:
+        return None
+
+async def parse_schedule_for_date(schedule_file: str, config: dict, target_date: datetime) -> Optional[str]:
+    """
+    Парсит расписание для указанной даты из Excel-файла.
+
+    Книга разбирается целиком один раз на версию файла (см. get_schedule),
+    дальше расписание на любую дату берётся из кэша.
+
+    Args:
+        schedule_file (str): Путь к файлу с расписанием
+        config (dict): Конфигурация с настройками парсинга
+        target_date (datetime): День, на который нужно получить расписание
+
+    Returns:
+        Optional[str]: Отформатированное расписание или None в случае ошибки
+    """
+    schedule = await get_schedule(schedule_file, config)
+    if schedule is None:
+        return None
+
+    day = find_day(schedule, target_date)
+    if day is None:
+        return None
+
+    return format_day_for_group(day, config['schedule_parser']['group_name'])
+
 async def parse_schedule_for_today(schedule_file: str, config: dict) -> Optional[str]:
     """Парсит расписание на сегодня"""
     today = (datetime.now())
@@ -117,4 +274,4 @@ async def parse_schedule_for_today(schedule_file: str, config: dict) -> Optional
 async def parse_schedule_for_tomorrow(schedule_file: str, config: dict) -> Optional[str]:
     """Парсит расписание на завтра"""
     tomorrow = (datetime.now() + timedelta(days=1))
-    return await parse_schedule_for_date(schedule_file, config, tomorrow)
\ No newline at end of file
+    return await parse_schedule_for_date(schedule_file, config, tomorrow)
@@ -0,0 +1,91 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+# Индекс строится один раз на версию расписания
+_index_cache = {'version': None, 'index': None}
+
+def tokenize(text: str) -> list:
+    """Разбивает текст на токены для поиска: нижний регистр, ё -> е"""
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+def build_search_index(schedule: dict) -> dict:
+    """
+    Строит инвертированный индекс по всем занятиям расписания (все группы и все дни).
+
+    Индексируются предметы, преподаватели, кабинеты и номер группы.
+
+    Args:
+        schedule (dict): Разобранное расписание (см. schedule_parser.read_schedule_file)
+
+    Returns:
+        dict: {'entries': [занятия], 'postings': {токен: set(номера занятий)}, 'tokens': [отсортированные токены]}
+    """
+    entries = []
+    postings = defaultdict(set)
+
+    for day in schedule['days']:
+        for group, group_entries in day['groups'].items():
+            for entry in group_entries:
+                if not entry['lines']:
+                    continue
+                entry_id = len(entries)
+                entries.append({
+                    'day': day['day'],
+                    'month': day['month'],
+                    'date_str': day['date_str'],
+                    'group': group,
+                    'time': entry['time'],
+                    'lines': entry['lines'],
+                    'rooms': entry['rooms'],
+                })
+                for text in [group, *entry['lines'], *entry['rooms']]:
+                    for token in tokenize(text):
+                        postings[token].add(entry_id)
+
+    return {'entries': entries, 'postings': dict(postings), 'tokens': sorted(postings)}
+
+def get_search_index(schedule: dict) -> dict:
+    """Возвращает индекс для версии расписания, перестраивая его только при смене версии"""
+    if _index_cache['version'] != schedule['version']:
+        _index_cache['index'] = build_search_index(schedule)
+        _index_cache['version'] = schedule['version']
+    return _index_cache['index']
+
+def _match_prefix(index: dict, prefix: str) -> set:
+    """Занятия, содержащие токен, начинающийся с prefix"""
+    tokens = index['tokens']
+    matched = set()
+    position = bisect_left(tokens, prefix)
+    while position < len(tokens) and tokens[position].startswith(prefix):
+        matched |= index['postings'][tokens[position]]
+        position += 1
+    return matched
+
+def search_schedule(schedule: dict, query: str, target_date: Optional[datetime] = None) -> list:
+    """
+    Ищет занятия по запросу: каждое слово запроса должно совпасть с началом слова занятия.
+
+    Args:
+        schedule (dict): Разобранное расписание
+        query (str): Поисковый запрос (фамилия преподавателя, кабинет, предмет, группа)
+        target_date (Optional[datetime]): Ограничить поиск днём
+
+    Returns:
+        list: Найденные занятия в порядке расписания
+    """
+    index = get_search_index(schedule)
+    query_tokens = tokenize(query)
+    if not query_tokens:
+        return []
+
+    # Начинаем с самого редкого токена, чтобы пересечения были дешёвыми
+    matches = sorted((_match_prefix(index, token) for token in query_tokens), key=len)
+    found = set.intersection(*matches)
+
+    results = [index['entries'][entry_id] for entry_id in sorted(found)]
+    if target_date is not None:
+        results = [entry for entry in results if entry['day'] == target_date.day and entry['month'] == target_date.month]
+    return results
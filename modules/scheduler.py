@@ -0,0 +1,114 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from cronsim import CronSim
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+def cron_next(expression: str, offset: timedelta = timedelta(0)) -> Callable[[datetime], datetime]:
+    """
+    Время следующего запуска по cron-выражению, сдвинутое на offset
+    (отрицательный сдвиг - запуск раньше, например прогрев перед рассылкой).
+    """
+    def next_run(after: datetime) -> datetime:
+        return next(CronSim(expression, after - offset)) + offset
+    return next_run
+
+def daily_next(time_value: str) -> Callable[[datetime], datetime]:
+    """Время следующего запуска каждый день в ЧЧ:ММ"""
+    hour, minute = map(int, time_value.split(":"))
+    def next_run(after: datetime) -> datetime:
+        run = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return run if run > after else run + timedelta(days=1)
+    return next_run
+
+class Scheduler:
+    """
+    Планировщик заданий на одной задаче asyncio.
+
+    Задания лежат в куче по времени следующего запуска: задача спит до ближайшего,
+    поэтому тысячи персональных рассылок стоят одну задачу и один таймер.
+    Замена или удаление задания не ищет его в куче - устаревшие записи пропускаются при извлечении.
+    """
+
+    # Максимальный сон: время проверяется заново, если системные часы перевели
+    MAX_SLEEP = 60
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._heap = []  # [(timestamp, порядковый номер, имя задания, поколение)]
+        self._jobs = {}  # {имя: {'next_run', 'callback', 'generation'}}
+        self._counter = itertools.count()
+        self._generations = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running = set()
+        self._task = None
+
+    def add_job(self, name: str, next_run: Callable[[datetime], datetime], callback: Callable[[], Awaitable]):
+        """Добавляет задание или заменяет задание с тем же именем"""
+        generation = next(self._generations)
+        self._jobs[name] = {'next_run': next_run, 'callback': callback, 'generation': generation}
+        self._push(name, next_run(datetime.now()), generation)
+
+    def remove_job(self, name: str):
+        self._jobs.pop(name, None)
+
+    def has_job(self, name: str) -> bool:
+        return name in self._jobs
+
+    def next_run_time(self, name: str) -> Optional[datetime]:
+        """Ближайший запуск задания (для логов и проверки)"""
+        job = self._jobs.get(name)
+        if job is None:
+            return None
+        runs = [when for when, _, job_name, generation in self._heap if job_name == name and generation == job['generation']]
+        return datetime.fromtimestamp(min(runs)) if runs else None
+
+    def _push(self, name: str, when: datetime, generation: int):
+        heapq.heappush(self._heap, (when.timestamp(), next(self._counter), name, generation))
+        self._wakeup.set()  # Новое задание могло оказаться раньше текущего ближайшего
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            when, _, name, generation = self._heap[0]
+            delay = when - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, self.MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            job = self._jobs.get(name)
+            if job is None or job['generation'] != generation:
+                continue  # Задание удалено или заменено
+
+            # Следующий запуск считается от текущего момента: пропущенные (например, во время сна) не накапливаются
+            self._push(name, job['next_run'](datetime.now()), generation)
+
+            task = asyncio.ensure_future(job['callback']())
+            self._running.add(task)
+            task.add_done_callback(lambda task, name=name: self._job_done(task, name))
+
+    def _job_done(self, task: asyncio.Task, name: str):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(self.config['logger_messages']['scheduler_error'].format(e=f"{name}: {task.exception()}"))
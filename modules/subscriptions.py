@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+import re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Режимы рассылки: "morning" - утром расписание на сегодня, "evening" - вечером расписание на завтра
+MODES = ("morning", "evening")
+
+def parse_time(value: str) -> Optional[str]:
+    """Время в формате ЧЧ:ММ (7:05, 07.05 -> 07:05) или None"""
+    match = re.fullmatch(r'(\d{1,2})[:.](\d{2})', value.strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+def load_subscriptions(file_path: str, config: dict) -> dict:
+    """
+    Загружает подписки на рассылку.
+
+    Returns:
+        dict: {user_id (int): {'mode': "morning"|"evening", 'time': "ЧЧ:ММ"}}
+    """
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return {int(user_id): subscription for user_id, subscription in json.load(f).items()}
+    except Exception as e:
+        logger.error(config['logger_messages']['subscriptions_load_error'].format(file_path=file_path, e=e))
+        return {}
+
+def save_subscriptions(file_path: str, subscriptions: dict, config: dict) -> bool:
+    """Сохраняет подписки атомарно (через временный файл)"""
+    try:
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(user_id): subscription for user_id, subscription in subscriptions.items()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception as e:
+        logger.error(config['logger_messages']['subscriptions_save_error'].format(file_path=file_path, e=e))
+        return False